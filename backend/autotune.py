@@ -0,0 +1,404 @@
+"""
+Hardware-aware runtime options for Ollama models.
+
+Tunings are kept per (backend, model). On a backend running on this machine,
+models get options derived from its cores, RAM and the model's size on disk.
+Remote backends get no thread/context overrides, so their Ollama server keeps
+choosing for its own hardware, until they are calibrated: a short benchmark
+run on that backend measures the best thread count, batch size, context
+window and number of concurrent generations. A model that was never
+calibrated on a backend is calibrated in the background the first time it is
+used there (KAGE_AUTO_CALIBRATE=0 turns that off). Results are stored in the
+ModelTuning table and applied to every LLM and embedding call sent to that
+backend.
+"""
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from threading import BoundedSemaphore, Lock, Thread
+from typing import Optional
+from urllib.parse import urlparse
+
+import ollama
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+
+from backend.database import engine
+from backend.models import ModelTuning
+from backend.ollama_pool import get_generation_pool, get_embedding_pool
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+CALIBRATION_PROMPT = "Explain in two sentences why the sky is blue. " * 8
+REMOTE_MAX_CONCURRENCY = 2            # generations in flight on a remote box we know nothing about
+REMOTE_THREAD_CANDIDATES = (4, 8, 16, 32)
+CONTEXT_CANDIDATES = (2048, 4096, 8192, 16384)
+CONCURRENCY_CANDIDATES = (1, 2, 4)
+AUTO_CALIBRATE = os.getenv("KAGE_AUTO_CALIBRATE", "1") != "0"
+
+
+def is_embedding_model(model: str) -> bool:
+    return "embed" in model
+
+
+# --- Hardware probe ---
+
+def physical_cores() -> int:
+    """Physical core count (hyperthreads don't help token generation much)"""
+    logical = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        cores = set()
+        with open("/proc/cpuinfo") as f:
+            physical_id = core_id = None
+            for line in f:
+                if line.startswith("physical id"):
+                    physical_id = line.split(":")[1].strip()
+                elif line.startswith("core id"):
+                    core_id = line.split(":")[1].strip()
+                elif not line.strip() and core_id is not None:
+                    cores.add((physical_id, core_id))
+                    physical_id = core_id = None
+        if cores:
+            return max(1, min(len(cores), logical))
+    except OSError:
+        pass
+    return logical
+
+
+def total_ram() -> int:
+    """Total physical memory in bytes"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 8 * GB
+
+
+def is_local(backend_url: str) -> bool:
+    """Whether a backend runs on this machine, so the local hardware probe applies to it"""
+    host = urlparse(backend_url).hostname or ""
+    return host in ("localhost", "127.0.0.1", "::1", "0.0.0.0") or host in (socket.gethostname(), socket.getfqdn())
+
+
+def hardware_profile() -> dict:
+    return {
+        "logical_cores": os.cpu_count() or 1,
+        "physical_cores": physical_cores(),
+        "ram_gb": round(total_ram() / GB, 1),
+    }
+
+
+def model_size(backend_url: str, model: str) -> int:
+    """Model size in bytes as recorded by the backend's last health check (0 if unknown)"""
+    for pool in (get_generation_pool(), get_embedding_pool()):
+        for backend in pool.backends:
+            if backend.url == backend_url and backend.has_model(model):
+                return backend.model_size(model)
+    return 0
+
+
+# --- Option heuristics ---
+
+def default_tuning(backend_url: str, model: str, size: Optional[int] = None) -> ModelTuning:
+    """Options used until a model is calibrated on a backend"""
+    if not is_local(backend_url):
+        # Our cores and RAM say nothing about another box; let its server decide
+        return ModelTuning(backend_url=backend_url, model=model, max_concurrency=REMOTE_MAX_CONCURRENCY)
+
+    cores = physical_cores()
+    ram = total_ram()
+    size = model_size(backend_url, model) if size is None else size
+    headroom = max(0, ram - size - 2 * GB)  # leave room for the OS and the app
+
+    if headroom < 4 * GB:
+        num_ctx = 2048
+    elif headroom < 12 * GB:
+        num_ctx = 4096
+    else:
+        num_ctx = 8192
+
+    # Each extra concurrent generation needs its own KV cache; small boxes get one
+    per_slot = max(size // 4, 512 * 1024 ** 2)
+    max_concurrency = 1 if cores <= 4 else max(1, min(4, cores // 8, headroom // per_slot))
+
+    return ModelTuning(
+        backend_url=backend_url,
+        model=model,
+        num_thread=cores,
+        num_ctx=num_ctx,
+        num_batch=256 if cores <= 4 else 512,
+        keep_alive="5m" if ram < 8 * GB else "30m",
+        max_concurrency=max_concurrency,
+    )
+
+
+# --- Cache of tunings and concurrency limits ---
+
+_tunings = {}        # {(backend_url, model): ModelTuning} loaded from the database or defaulted
+_slots = {}          # {(backend_url, model): (BoundedSemaphore, limit)}
+_auto_started = set()  # keys auto-calibration was started for in this process
+_lock = Lock()
+
+
+def load_tunings():
+    """Load stored tunings; called at startup so requests never query for them"""
+    try:
+        with Session(engine) as session:
+            rows = session.exec(select(ModelTuning)).all()
+            for row in rows:
+                session.expunge(row)
+    except OperationalError as e:
+        # A database from before tunings existed (or none at all): use defaults
+        logger.warning(f"No stored model tunings, using defaults: {e.orig}")
+        return
+    with _lock:
+        _tunings.update({(row.backend_url, row.model): row for row in rows})
+
+
+def get_tuning(backend_url: str, model: str) -> ModelTuning:
+    key = (backend_url, model)
+    with _lock:
+        tuning = _tunings.get(key)
+    if tuning is None:
+        tuning = default_tuning(backend_url, model)
+        with _lock:
+            tuning = _tunings.setdefault(key, tuning)
+    return tuning
+
+
+def _auto_calibrate(backend_url: str, model: str, tuning: ModelTuning):
+    """Calibrate a model the first time it is used on a backend it was never calibrated on"""
+    if not AUTO_CALIBRATE or tuning.calibrated_at is not None:
+        return
+    key = (backend_url, model)
+    with _lock:
+        if key in _auto_started:
+            return
+        _auto_started.add(key)
+    logger.info(f"{model} was never calibrated on {backend_url}; calibrating in the background")
+    get_calibrator().start(model, backend_url)
+
+
+def runtime_options(backend_url: str, model: str) -> dict:
+    """Ollama `options` for a model on one backend (only the ones we have a value for)"""
+    tuning = get_tuning(backend_url, model)
+    _auto_calibrate(backend_url, model, tuning)
+    options = {"num_thread": tuning.num_thread, "num_ctx": tuning.num_ctx, "num_batch": tuning.num_batch}
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def keep_alive(backend_url: str, model: str) -> Optional[str]:
+    return get_tuning(backend_url, model).keep_alive
+
+
+def tuning_version(backend_url: str, model: str) -> tuple:
+    """Changes whenever a model is re-tuned, so cached clients can be rebuilt"""
+    tuning = get_tuning(backend_url, model)
+    return (tuning.num_thread, tuning.num_ctx, tuning.num_batch, tuning.keep_alive)
+
+
+def _slot(backend_url: str, model: str) -> tuple:
+    key = (backend_url, model)
+    limit = get_tuning(backend_url, model).max_concurrency
+    with _lock:
+        if key not in _slots:
+            _slots[key] = (BoundedSemaphore(limit), limit)
+        return _slots[key]
+
+
+@contextmanager
+def generation_slot(backend_url: str, model: str):
+    """Limit concurrent generations of a model on one backend to its tuned maximum"""
+    slot, _ = _slot(backend_url, model)
+    with slot:
+        yield
+
+
+@contextmanager
+def exclusive_slot(backend_url: str, model: str):
+    """Hold every generation slot of a model on one backend, so nothing else runs on it"""
+    slot, limit = _slot(backend_url, model)
+    held = 0
+    try:
+        for _ in range(limit):
+            slot.acquire()
+            held += 1
+        yield
+    finally:
+        for _ in range(held):
+            slot.release()
+
+
+# --- Calibration ---
+
+class Calibrator:
+    """Runs calibration benchmarks in the background and reports their status"""
+
+    def __init__(self):
+        self.status = {}  # {(backend_url, model): {status, step, error}}
+
+    def start(self, model: str, backend_url: Optional[str] = None) -> list:
+        """
+        Calibrate a model on one backend, or on every backend that has it.
+
+        Returns:
+            The backend URLs a calibration was started (or is running) for
+        """
+        if backend_url:
+            urls = [backend_url]
+        else:
+            pool = get_embedding_pool() if is_embedding_model(model) else get_generation_pool()
+            pool.refresh()
+            urls = [b.url for b in pool.backends if b.has_model(model)]
+        for url in urls:
+            key = (url, model)
+            if self.status.get(key, {}).get("status") == "running":
+                continue
+            self.status[key] = {"status": "running", "step": "starting", "error": None}
+            Thread(target=self._run, args=(url, model), daemon=True).start()
+        return urls
+
+    def _generate(self, backend, model, prompt, options, num_predict):
+        if is_embedding_model(model):
+            # Embedding models can't generate; time a small embedding batch instead
+            start = time.perf_counter()
+            backend.client.embed(model=model, input=[prompt] * 8, options=options, keep_alive="5m")
+            rate = 8 / max(time.perf_counter() - start, 1e-6)
+            return rate, rate
+        resp = backend.client.generate(model=model, prompt=prompt, stream=False, keep_alive="5m",
+                                       options={**options, "num_predict": num_predict, "temperature": 0})
+        eval_rate = resp["eval_count"] / (resp["eval_duration"] / 1e9) if resp.get("eval_duration") else 0.0
+        prompt_rate = (resp["prompt_eval_count"] / (resp["prompt_eval_duration"] / 1e9)
+                       if resp.get("prompt_eval_duration") else 0.0)
+        return eval_rate, prompt_rate
+
+    def _bench(self, backend, model, prompt, options, num_predict):
+        """(generation tok/s, prompt tok/s) of one request, with the model to itself"""
+        # Chat turns wait between benchmarks rather than skewing them
+        with exclusive_slot(backend.url, model):
+            return self._generate(backend, model, prompt, options, num_predict)
+
+    def _bench_parallel(self, backend, model, options, parallel):
+        """Aggregate requests per second with `parallel` requests in flight at once"""
+        with exclusive_slot(backend.url, model), ThreadPoolExecutor(parallel) as executor:
+            start = time.perf_counter()
+            # Distinct prompts so no request is answered from another's prompt cache
+            list(executor.map(lambda i: self._generate(backend, model, f"[{parallel}.{i}] {CALIBRATION_PROMPT}",
+                                                       options, 32), range(parallel)))
+            return parallel / max(time.perf_counter() - start, 1e-6)
+
+    def _run(self, backend_url: str, model: str):
+        key = (backend_url, model)
+        try:
+            tuning = default_tuning(backend_url, model)
+            base = {name: value for name, value in (("num_ctx", tuning.num_ctx), ("num_batch", tuning.num_batch))
+                    if value is not None}
+            pool = get_embedding_pool() if is_embedding_model(model) else get_generation_pool()
+
+            with pool.lease(model, prefer=backend_url) as backend:
+                if backend.url != backend_url:
+                    raise RuntimeError(f"Backend {backend_url} is not available")
+                self.status[key]["step"] = "warming up"
+                self._bench(backend, model, "Hi", runtime_options(backend_url, model), 1)
+
+                # Generation speed is bound by memory bandwidth; more threads than
+                # physical cores usually hurts, but measure rather than assume.
+                # None keeps the server's own choice, so calibration never ends
+                # up worse than leaving the backend alone.
+                if is_local(backend_url):
+                    cores = physical_cores()
+                    candidates = sorted({max(1, cores // 2), max(1, cores - 1), cores, os.cpu_count() or cores})
+                else:
+                    candidates = list(REMOTE_THREAD_CANDIDATES)
+                best_threads, best_rate = tuning.num_thread, 0.0
+                for threads in [None] + candidates:
+                    self.status[key]["step"] = f"num_thread={threads or 'default'}"
+                    options = {**base, "num_thread": threads} if threads else base
+                    rate, _ = self._bench(backend, model, CALIBRATION_PROMPT, options, 32)
+                    logger.info(f"Calibration {model} on {backend_url}: num_thread={threads or 'default'} -> {rate:.1f} tok/s")
+                    if rate > best_rate:
+                        best_threads, best_rate = threads, rate
+
+                # Batch size mostly affects prompt evaluation
+                threads_option = {"num_thread": best_threads} if best_threads else {}
+                best_batch, best_prompt_rate = tuning.num_batch, 0.0
+                for batch in (128, 256, 512):
+                    self.status[key]["step"] = f"num_batch={batch}"
+                    # Vary the prompt so Ollama's prompt cache doesn't skip evaluation
+                    _, prompt_rate = self._bench(backend, model, f"[{batch}] {CALIBRATION_PROMPT}",
+                                                 {**base, **threads_option, "num_batch": batch}, 1)
+                    if prompt_rate > best_prompt_rate:
+                        best_batch, best_prompt_rate = batch, prompt_rate
+                options = {**base, **threads_option, "num_batch": best_batch}
+
+                # Largest context window that loads and keeps its speed; a bigger KV
+                # cache that no longer fits in (V)RAM shows up as a slowdown or an
+                # error. Locally the RAM headroom bounds what is worth trying.
+                best_ctx, ctx_base_rate = tuning.num_ctx, 0.0
+                for num_ctx in CONTEXT_CANDIDATES:
+                    if tuning.num_ctx and is_local(backend_url) and num_ctx > tuning.num_ctx:
+                        break
+                    self.status[key]["step"] = f"num_ctx={num_ctx}"
+                    try:
+                        rate, _ = self._bench(backend, model, f"[{num_ctx}] {CALIBRATION_PROMPT}",
+                                              {**options, "num_ctx": num_ctx}, 32)
+                    except ollama.ResponseError as e:
+                        logger.info(f"Calibration {model} on {backend_url}: num_ctx={num_ctx} failed: {e}")
+                        break
+                    ctx_base_rate = ctx_base_rate or rate
+                    if rate < 0.9 * ctx_base_rate:
+                        break
+                    best_ctx = num_ctx
+                if best_ctx:
+                    options["num_ctx"] = best_ctx
+
+                # Concurrent generations only pay off if the server runs them in
+                # parallel (OLLAMA_NUM_PARALLEL) and the hardware keeps up
+                best_concurrency, best_throughput = 1, 0.0
+                for parallel in CONCURRENCY_CANDIDATES:
+                    self.status[key]["step"] = f"max_concurrency={parallel}"
+                    throughput = self._bench_parallel(backend, model, options, parallel)
+                    logger.info(f"Calibration {model} on {backend_url}: {parallel} in flight -> {throughput:.2f} req/s")
+                    if best_throughput and throughput < 1.2 * best_throughput:
+                        break
+                    best_concurrency, best_throughput = parallel, throughput
+
+            tuning.num_thread = best_threads
+            tuning.num_batch = best_batch
+            tuning.num_ctx = best_ctx
+            tuning.max_concurrency = best_concurrency
+            tuning.tokens_per_second = round(best_rate, 2)
+            self._save(tuning)
+            self.status[key] = {"status": "completed", "step": None, "error": None}
+        except Exception as e:
+            logger.error(f"Calibration of {model} on {backend_url} failed: {e}")
+            self.status[key] = {"status": "failed", "step": None, "error": str(e)}
+
+    def _save(self, tuning: ModelTuning):
+        with Session(engine) as session:
+            row = session.exec(select(ModelTuning).where(ModelTuning.backend_url == tuning.backend_url,
+                                                         ModelTuning.model == tuning.model)).first() \
+                or ModelTuning(backend_url=tuning.backend_url, model=tuning.model)
+            for key in ("num_thread", "num_ctx", "num_batch", "keep_alive", "max_concurrency", "tokens_per_second"):
+                setattr(row, key, getattr(tuning, key))
+            row.calibrated_at = datetime.utcnow()
+            session.add(row)
+            session.commit()
+            session.refresh(row)
+            session.expunge(row)
+        with _lock:
+            _tunings[(row.backend_url, row.model)] = row
+            # New concurrency limit applies to the next generation
+            _slots.pop((row.backend_url, row.model), None)
+
+
+# Global calibrator instance
+_calibrator = Calibrator()
+
+def get_calibrator() -> Calibrator:
+    """Get the global calibration runner"""
+    return _calibrator
@@ -0,0 +1,211 @@
+"""
+Run JSONL prompt sets through the full chat pipeline with bounded concurrency.
+
+Each input line is a job:
+    {"id": "q1", "message": "...", "chat_id": 3}              # continue an existing chat
+    {"id": "q2", "message": "...", "project_id": 1}           # fresh chat inside a project
+    {"id": "q3", "message": "...", "model": "llama3.2:1b"}    # fresh standalone chat
+
+Jobs for the same chat_id run one after another in file order; everything
+else runs concurrently. Results are appended to an output JSONL as they
+finish, so an interrupted run can be resumed: jobs already recorded as "ok"
+are skipped, and jobs not yet started are never sent.
+
+A job recorded as an error may still have completed on the server (e.g. a
+client timeout), so resuming skips it too unless retry_errors is set; a
+retried job reuses the chat recorded for it instead of creating another.
+"""
+import json
+import logging
+import os
+import statistics
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Event, Lock
+from typing import Callable, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+def load_jobs(path: str) -> List[dict]:
+    """Read jobs from a JSONL file, defaulting each id to its line number"""
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            if "message" not in job:
+                raise ValueError(f"{path}:{line_no}: job has no 'message'")
+            job.setdefault("id", str(line_no))
+            job["id"] = str(job["id"])
+            jobs.append(job)
+    return jobs
+
+
+def previous_results(path: str) -> dict:
+    """Latest recorded result per job id from earlier runs"""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interrupted run
+            results[str(result["id"])] = result
+    return results
+
+
+class BatchRunner:
+    """Sends jobs to the chat API over a shared pool of keep-alive connections"""
+
+    def __init__(self, base_url: str = "http://localhost:8000/api", concurrency: int = 4,
+                 timeout: float = 300.0):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+    @staticmethod
+    def lanes(jobs: Iterable[dict]) -> List[List[dict]]:
+        """
+        Group jobs into lanes that each run sequentially. Turns in the same
+        chat share a lane in file order, so its history is never scrambled;
+        every other job gets a lane of its own.
+        """
+        lanes, by_chat = [], {}
+        for job in jobs:
+            if job.get("chat_id"):
+                lane = by_chat.get(str(job["chat_id"]))
+                if lane is None:
+                    lane = by_chat[str(job["chat_id"])] = []
+                    lanes.append(lane)
+                lane.append(job)
+            else:
+                lanes.append([job])
+        return lanes
+
+    def _resolve_chat(self, job: dict) -> int:
+        if job.get("chat_id"):
+            return int(job["chat_id"])
+        params = {"project_id": job["project_id"]} if job.get("project_id") else None
+        resp = self.http.post(f"{self.base_url}/chats/", params=params,
+                              json={"title": job.get("title") or f"Batch {job['id']}"}, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    def run_job(self, job: dict) -> dict:
+        start = time.perf_counter()
+        result = {"id": job["id"]}
+        try:
+            chat_id = self._resolve_chat(job)
+            result["chat_id"] = chat_id
+            resp = self.http.post(f"{self.base_url}/chat_completion/", json={
+                "chat_id": chat_id,
+                "user_message": job["message"],
+                "model": job.get("model"),
+            }, timeout=self.timeout)
+            resp.raise_for_status()
+            result.update(status="ok", content=resp.json()["content"])
+        except Exception as e:
+            detail = getattr(getattr(e, "response", None), "text", "") or str(e)
+            result.update(status="error", error=detail)
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def run(self, jobs: Iterable[dict], output_path: str,
+            progress_callback: Optional[Callable] = None, retry_errors: bool = False) -> dict:
+        """
+        Run jobs and append each result to output_path as soon as it finishes.
+
+        Args:
+            jobs: Job dicts (see module docstring)
+            output_path: JSONL file; existing results are skipped (resume)
+            progress_callback: Optional callback called with (result, finished, total)
+            retry_errors: Re-send jobs whose previous attempt was recorded as an error
+
+        Returns:
+            Throughput statistics for this run
+        """
+        previous = previous_results(output_path)
+        pending, done = [], 0
+        for job in jobs:
+            result = previous.get(job["id"])
+            if result is None:
+                pending.append(job)
+            elif result.get("status") != "ok" and retry_errors:
+                if result.get("chat_id") and not job.get("chat_id"):
+                    job = {**job, "chat_id": result["chat_id"]}  # its chat already exists
+                pending.append(job)
+            else:
+                done += 1
+        if done:
+            logger.info(f"Resuming: {done} jobs already recorded, {len(pending)} to go")
+
+        results = []
+        write_lock = Lock()
+        stop = Event()
+        start = time.perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as out:
+            def run_lane(lane):
+                for job in lane:
+                    if stop.is_set():
+                        return
+                    result = self.run_job(job)
+                    with write_lock:
+                        out.write(json.dumps(result) + "\n")
+                        out.flush()
+                        results.append(result)
+                        finished = len(results)
+                    if progress_callback:
+                        progress_callback(result, finished, len(pending))
+
+            pool = ThreadPoolExecutor(max_workers=self.concurrency)
+            try:
+                # Only `concurrency` lanes are submitted at a time, so an interrupt
+                # leaves nothing queued that would still be sent to the server
+                queued = iter(self.lanes(pending))
+                running = set()
+                while True:
+                    for lane in queued:
+                        running.add(pool.submit(run_lane, lane))
+                        if len(running) >= self.concurrency:
+                            break
+                    if not running:
+                        break
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+            finally:
+                # On Ctrl-C: start no new jobs, let the ones in flight record their result
+                stop.set()
+                pool.shutdown(wait=True, cancel_futures=True)
+
+        return self.stats(results, time.perf_counter() - start, skipped=done)
+
+    @staticmethod
+    def stats(results: List[dict], elapsed: float, skipped: int = 0) -> dict:
+        ok = [r for r in results if r["status"] == "ok"]
+        latencies = sorted(r["latency_ms"] for r in ok)
+        return {
+            "jobs": len(results),
+            "ok": len(ok),
+            "errors": len(results) - len(ok),
+            "skipped": skipped,
+            "elapsed_s": round(elapsed, 2),
+            "jobs_per_s": round(len(results) / elapsed, 3) if elapsed else 0.0,
+            "output_chars_per_s": round(sum(len(r["content"]) for r in ok) / elapsed, 1) if elapsed else 0.0,
+            "latency_p50_ms": statistics.median(latencies) if latencies else None,
+            "latency_p95_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            "latency_max_ms": latencies[-1] if latencies else None,
+        }
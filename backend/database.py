@@ -1,7 +1,8 @@
+import os
 from sqlmodel import SQLModel, create_engine, Session
 
-# SQLite Database, located in the root project folder
-sqlite_file_name = "kage.db"
+# SQLite Database, located in the root project folder (override with KAGE_DB)
+sqlite_file_name = os.environ.get("KAGE_DB", "kage.db")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
 connect_args = {"check_same_thread": False}
@@ -15,14 +15,17 @@ class DownloadProgressTracker:
     def __init__(self):
         self.active_downloads = {}  # {model_name: {status, progress, size, downloaded}}
 
-    def start_download(self, model_name: str, progress_callback: Optional[Callable] = None):
+    def start_download(self, model_name: str, progress_callback: Optional[Callable] = None,
+                       client: Optional[ollama.Client] = None):
         """
         Start downloading a model with progress tracking
 
         Args:
             model_name: Name of the model to download (e.g., "deepseek-r1:1.5b")
             progress_callback: Optional callback function called with progress updates
+            client: Ollama client of the backend to pull onto (defaults to OLLAMA_HOST)
         """
+        puller = client or ollama
         def download_worker():
             try:
                 self.active_downloads[model_name] = {
@@ -36,7 +39,7 @@ class DownloadProgressTracker:
                 logger.info(f"Starting download of {model_name}")
 
                 # Pull the model with streaming progress
-                stream = ollama.pull(model_name, stream=True)
+                stream = puller.pull(model_name, stream=True)
 
                 for chunk in stream:
                     if 'status' in chunk:
@@ -0,0 +1,142 @@
+"""
+Conditional GET support (ETag / Last-Modified) and fast JSON responses.
+
+Every committed insert/update/delete on a tracked table bumps an in-process
+version counter, both for the whole table and for the chat a row belongs to.
+Changes are collected at flush time but only published once the transaction
+commits, so a concurrent reader never pairs a new ETag with old rows. List
+endpoints derive their ETag from the versions they depend on, so an unchanged
+collection is answered with 304 before the database is even queried.
+
+The versions live in this process only, so validators are correct only while
+one process writes the database: run a single uvicorn worker, and don't edit
+kage.db from outside the app while it is serving. Set KAGE_HTTP_CACHE=0 for
+any other deployment; responses are then always built and carry no validators.
+"""
+import hashlib
+import os
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from threading import Lock
+from typing import Any, Callable, List, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from backend.models import Project, Chat, Message, GlobalSettings, ContextItem
+
+# orjson is optional - fall back to the standard library encoder
+try:
+    import orjson
+
+    class FastJSONResponse(JSONResponse):
+        """JSONResponse rendered with orjson"""
+
+        def render(self, content: Any) -> bytes:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    FastJSONResponse = JSONResponse
+
+
+# Changes when the process restarts, so clients never reuse ETags across restarts
+_boot_id = uuid.uuid4().hex[:8]
+ENABLED = os.environ.get("KAGE_HTTP_CACHE", "1").lower() not in ("0", "false", "no")
+_versions = {}        # {(table, scope): counter}
+_modified = {}        # {(table, scope): unix time of last change}
+_lock = Lock()
+
+
+_PENDING = "kage_pending_versions"
+
+
+def _collect(mapper, connection, target):
+    """Remember which versions a flushed change will bump once it commits"""
+    session = object_session(target)
+    if session is None:
+        return
+    table = target.__tablename__
+    pending = session.info.setdefault(_PENDING, set())
+    pending.add((table, None))
+    chat_id = getattr(target, "chat_id", None)
+    if chat_id is not None:
+        pending.add((table, chat_id))
+
+
+def _publish(session):
+    keys = session.info.pop(_PENDING, None)
+    if not keys:
+        return
+    now = time.time()
+    with _lock:
+        for key in keys:
+            _versions[key] = _versions.get(key, 0) + 1
+            _modified[key] = now
+
+
+def _discard(session, previous_transaction=None):
+    session.info.pop(_PENDING, None)
+
+
+for _model in (Project, Chat, Message, GlobalSettings, ContextItem):
+    for _event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event_name, _collect)
+
+event.listen(Session, "after_commit", _publish)
+event.listen(Session, "after_rollback", _discard)
+
+
+def collection_key(table: str, chat_id: int = None) -> Tuple[str, Any]:
+    """Version key for a whole table, or for the rows of one chat"""
+    return (table, chat_id)
+
+
+def _validators(keys: List[Tuple[str, Any]]):
+    with _lock:
+        versions = [f"{t}:{s}:{_versions.get((t, s), 0)}" for t, s in keys]
+        modified = max((_modified.get(k, 0.0) for k in keys), default=0.0)
+    digest = hashlib.sha1("|".join(versions).encode("utf-8")).hexdigest()[:16]
+    return f'W/"{_boot_id}-{digest}"', modified
+
+
+def _not_modified(request: Request, etag: str, modified: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have 1s resolution: only a change in an earlier second is safe to skip
+        return modified < since
+    return False
+
+
+def cached_json(request: Request, keys: List[Tuple[str, Any]], build: Callable[[], Any]) -> Response:
+    """
+    Serve build()'s result as JSON with ETag/Last-Modified validators, or an
+    empty 304 when the client's copy is still current.
+
+    Args:
+        request: Incoming request (for If-None-Match / If-Modified-Since)
+        keys: collection_key()s the payload depends on
+        build: Produces the payload; only called on a cache miss
+    """
+    if not ENABLED:
+        return FastJSONResponse(content=jsonable_encoder(build()))
+
+    etag, modified = _validators(keys)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if modified:
+        headers["Last-Modified"] = formatdate(modified, usegmt=True)
+
+    if _not_modified(request, etag, modified):
+        return Response(status_code=304, headers=headers)
+
+    return FastJSONResponse(content=jsonable_encoder(build()), headers=headers)
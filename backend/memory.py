@@ -0,0 +1,319 @@
+"""
+Long-term memory shared across chats.
+
+Durable facts are extracted from finished turns in the background, embedded,
+de-duplicated and stored as MemoryRecords scoped to the whole app (global) or
+to one project. Large global/project context blobs are split into chunks and
+stored the same way. Each turn then injects only the most relevant records,
+under a token budget, instead of pasting every blob in full.
+
+Extraction is low priority: it only runs on a backend that has been idle for
+a while, preferring one that holds no chat's warm session (see session_cache),
+so it never delays a chat turn or needlessly evicts a cached context. A turn
+that finds no idle backend with its model within EXTRACTION_MAX_WAIT is
+dropped.
+
+Enable with KAGE_MEMORY=1. Records are kept in an in-process index loaded at
+startup, so recall costs one embedding call and no database queries.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock, Thread
+from typing import List, Optional
+
+from sqlmodel import Session, select
+
+from backend.database import engine
+from backend.models import MemoryRecord
+from backend.ollama_pool import get_generation_pool, get_embedding_pool
+from backend.autotune import runtime_options, keep_alive
+from backend.session_cache import get_session_cache
+
+logger = logging.getLogger(__name__)
+
+MEMORY_ENABLED = os.environ.get("KAGE_MEMORY", "").lower() in ("1", "true", "yes")
+EMBED_MODEL = "nomic-embed-text"
+TOKEN_BUDGET = 400           # tokens of memories injected per turn
+TOP_K = 8                    # most records considered per turn
+MIN_SIMILARITY = 0.35        # below this a record is not relevant
+DUPLICATE_SIMILARITY = 0.92  # above this a new fact repeats an existing one
+STATIC_BLOB_CHARS = 1500     # blobs longer than this are retrieved, not pasted
+CHUNK_CHARS = 600
+EXTRACTION_IDLE = 3.0        # seconds a backend must be quiet before extraction uses it
+WARM_SESSION_IDLE = 60.0     # ... or this long if it holds a chat's warm session
+EXTRACTION_POLL = 1.0        # seconds between idle checks
+EXTRACTION_MAX_WAIT = 600.0  # give up on a turn if no idle backend has its model by then
+EXTRACTION_MAX_TOKENS = 200
+MAX_PENDING_TURNS = 50       # oldest turns are dropped beyond this backlog
+
+EXTRACTION_PROMPT = """From the exchange below, list durable facts worth remembering for future conversations: the user's preferences, background, goals, decisions and project details. Skip anything specific to this one question, small talk, and general knowledge.
+Write one short, self-contained fact per line starting with "- ". If there is nothing worth remembering, reply with NONE.
+
+User: {user}
+
+Assistant: {assistant}"""
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def embed(texts: List[str]) -> List[List[float]]:
+    with get_embedding_pool().lease(EMBED_MODEL) as backend:
+        resp = backend.client.embed(model=EMBED_MODEL, input=texts, options=runtime_options(backend.url, EMBED_MODEL),
+                                    keep_alive=keep_alive(backend.url, EMBED_MODEL))
+    return [list(v) for v in resp["embeddings"]]
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS) -> List[str]:
+    """Split on paragraphs, packing them into chunks of roughly `size` characters"""
+    chunks, current = [], ""
+    for para in (p.strip() for p in re.split(r"\n\s*\n", text)):
+        if not para:
+            continue
+        while len(para) > size:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(para[:size])
+            para = para[size:]
+        if current and len(current) + len(para) + 2 > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{para}" if current else para
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class _Entry:
+    """In-memory copy of a MemoryRecord with its decoded vector"""
+
+    def __init__(self, record: MemoryRecord):
+        self.id = record.id
+        self.scope = record.scope
+        self.project_id = record.project_id
+        self.source = record.source
+        self.content = record.content
+        self.content_hash = record.content_hash
+        self.blob_hash = record.blob_hash
+        self.vector = json.loads(record.embedding)
+
+    def in_scope(self, project_id: Optional[int]) -> bool:
+        return self.scope == "global" or (project_id is not None and self.project_id == project_id)
+
+
+class MemoryStore:
+    """Memory records, persisted in the database and indexed in memory"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = Lock()
+        # Embedding-only work (indexing context blobs)
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory")
+        # Finished turns waiting for an idle backend to extract facts on
+        self._turns = deque(maxlen=MAX_PENDING_TURNS)
+        self._turns_ready = Condition()
+        self._extractor = None
+
+    def load(self):
+        """Load all records; called at startup"""
+        with Session(engine) as session:
+            entries = [_Entry(r) for r in session.exec(select(MemoryRecord)).all()]
+        with self._lock:
+            self._entries = {e.id: e for e in entries}
+
+    def entries(self, project_id: Optional[int] = None, include_global: bool = True) -> List[_Entry]:
+        with self._lock:
+            return [e for e in self._entries.values()
+                    if (include_global and e.scope == "global") or (project_id is not None and e.project_id == project_id)]
+
+    # --- Writing ---
+
+    def _add(self, session: Session, content: str, vector: List[float], scope: str, project_id: Optional[int],
+             source: str = "extracted", source_chat_id: Optional[int] = None, blob_hash: Optional[str] = None) -> bool:
+        """Store a record unless it duplicates one already in scope"""
+        digest = text_hash(content)
+        for entry in self.entries(project_id if scope == "project" else None):
+            if entry.scope != scope or entry.source != source:
+                continue
+            if entry.content_hash == digest or (source == "extracted" and cosine(entry.vector, vector) >= DUPLICATE_SIMILARITY):
+                return False
+
+        record = MemoryRecord(scope=scope, project_id=project_id, source=source, content=content,
+                              content_hash=digest, embedding=json.dumps(vector),
+                              source_chat_id=source_chat_id, blob_hash=blob_hash)
+        session.add(record)
+        session.commit()
+        session.refresh(record)
+        with self._lock:
+            self._entries[record.id] = _Entry(record)
+        return True
+
+    def delete(self, record_id: int) -> bool:
+        with Session(engine) as session:
+            record = session.get(MemoryRecord, record_id)
+            if not record:
+                return False
+            session.delete(record)
+            session.commit()
+        with self._lock:
+            self._entries.pop(record_id, None)
+        return True
+
+    def forget_project(self, project_id: int):
+        """Remove every record scoped to a deleted project"""
+        for entry in self.entries(project_id, include_global=False):
+            self.delete(entry.id)
+
+    # --- Fact extraction ---
+
+    def idle_backend(self, model: str):
+        """
+        A backend with the model and nothing in flight for a while, or None.
+        Backends without a warm chat session are preferred; one that holds a
+        session must be quiet for much longer, since extraction evicts it.
+        """
+        warm = get_session_cache().backend_urls()
+        now = time.monotonic()
+        candidates = [
+            b for b in get_generation_pool().backends
+            if b.available and b.healthy is not False and b.has_model(model) and b.in_flight == 0
+            and now - b.last_used >= (WARM_SESSION_IDLE if b.url in warm else EXTRACTION_IDLE)
+        ]
+        return min(candidates, key=lambda b: (b.url in warm, b.last_used), default=None)
+
+    def extract_facts(self, backend_url: str, model: str, user_message: str, assistant_message: str) -> List[str]:
+        prompt = EXTRACTION_PROMPT.format(user=user_message, assistant=assistant_message)
+        # No generation_slot: chat turns must never queue behind extraction
+        with get_generation_pool().lease(model, prefer=backend_url) as backend:
+            resp = backend.client.generate(model=model, prompt=prompt, stream=False,
+                                           options={**runtime_options(backend.url, model), "temperature": 0,
+                                                    "num_predict": EXTRACTION_MAX_TOKENS},
+                                           keep_alive=keep_alive(backend.url, model))
+        text = resp["response"].strip()
+        if text.upper().startswith("NONE"):
+            return []
+        facts = [line.lstrip("-*• ").strip() for line in text.splitlines() if line.strip().startswith(("-", "*", "•"))]
+        return [f for f in facts if 10 <= len(f) <= 300]
+
+    def _remember_turn(self, backend_url, chat_id, project_id, model, user_message, assistant_message):
+        try:
+            facts = self.extract_facts(backend_url, model, user_message, assistant_message)
+            if not facts:
+                return
+            vectors = embed(facts)
+            scope = "project" if project_id else "global"
+            added = 0
+            with Session(engine) as session:
+                for fact, vector in zip(facts, vectors):
+                    added += self._add(session, fact, vector, scope, project_id, source_chat_id=chat_id)
+            logger.info(f"Memory: {added} new fact(s) from chat {chat_id} ({len(facts) - added} duplicate)")
+        except Exception as e:
+            logger.warning(f"Memory extraction failed for chat {chat_id}: {e}")
+
+    def remember_turn(self, chat_id: int, project_id: Optional[int], model: str,
+                      user_message: str, assistant_message: str):
+        """Queue fact extraction for a finished turn"""
+        with self._turns_ready:
+            if len(self._turns) == self._turns.maxlen:
+                logger.warning("Memory: extraction backlog full, dropping the oldest turn")
+            self._turns.append((chat_id, project_id, model, user_message, assistant_message))
+            if self._extractor is None:
+                self._extractor = Thread(target=self._extract_loop, daemon=True, name="memory-extract")
+                self._extractor.start()
+            self._turns_ready.notify()
+
+    def _extract_loop(self):
+        while True:
+            with self._turns_ready:
+                while not self._turns:
+                    self._turns_ready.wait()
+                turn = self._turns.popleft()
+            deadline = time.monotonic() + EXTRACTION_MAX_WAIT
+            backend = self.idle_backend(turn[2])
+            while backend is None and time.monotonic() < deadline:
+                time.sleep(EXTRACTION_POLL)
+                backend = self.idle_backend(turn[2])
+            if backend is None:
+                # Model gone, or every backend busy for too long; later turns get their chance
+                logger.warning(f"Memory: no idle backend with {turn[2]} for {EXTRACTION_MAX_WAIT:.0f}s, "
+                               f"skipping extraction for chat {turn[0]}")
+                continue
+            self._remember_turn(backend.url, *turn)
+
+    # --- Static context blobs ---
+
+    def static_indexed(self, text: str, scope: str, project_id: Optional[int] = None) -> bool:
+        """True if this exact blob's chunks are in the index"""
+        digest = text_hash(text)
+        return any(e.source == "static" and e.scope == scope and e.blob_hash == digest
+                   for e in self.entries(project_id if scope == "project" else None))
+
+    def _sync_static(self, text: str, scope: str, project_id: Optional[int]):
+        try:
+            digest = text_hash(text or "")
+            stale = [e.id for e in self.entries(project_id if scope == "project" else None)
+                     if e.source == "static" and e.scope == scope and e.blob_hash != digest]
+            for record_id in stale:
+                self.delete(record_id)
+            if not text or len(text) <= STATIC_BLOB_CHARS or self.static_indexed(text, scope, project_id):
+                return
+            chunks = chunk_text(text)
+            vectors = embed(chunks)
+            with Session(engine) as session:
+                for chunk, vector in zip(chunks, vectors):
+                    self._add(session, chunk, vector, scope, project_id, source="static", blob_hash=digest)
+            logger.info(f"Memory: indexed {len(chunks)} chunk(s) of {scope} context")
+        except Exception as e:
+            logger.warning(f"Indexing {scope} context failed: {e}")
+
+    def sync_static(self, text: Optional[str], scope: str, project_id: Optional[int] = None):
+        """Queue (re-)indexing of a global or project context blob"""
+        self._worker.submit(self._sync_static, text, scope, project_id)
+
+    # --- Recall ---
+
+    def recall(self, query: str, project_id: Optional[int], budget: int = TOKEN_BUDGET) -> List[_Entry]:
+        """Most relevant records for a query that fit in the token budget"""
+        candidates = self.entries(project_id)
+        if not candidates:
+            return []
+        vector = embed([query])[0]
+        scored = sorted(((cosine(vector, e.vector), e) for e in candidates), key=lambda x: x[0], reverse=True)
+
+        chosen, used = [], 0
+        for score, entry in scored[:TOP_K]:
+            if score < MIN_SIMILARITY:
+                break
+            cost = estimate_tokens(entry.content)
+            if used + cost > budget:
+                continue
+            chosen.append(entry)
+            used += cost
+        return chosen
+
+
+# Global memory store
+_store = MemoryStore()
+
+def get_memory_store() -> MemoryStore:
+    """Get the global long-term memory store"""
+    return _store
@@ -52,3 +52,27 @@ class ContextItem(SQLModel, table=True):
     
     chat: Optional["Chat"] = Relationship(back_populates="context_items")
 
+
+class ModelTuning(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    backend_url: str = Field(default="", index=True) # tunings are per (backend, model)
+    model: str = Field(index=True)
+    num_thread: Optional[int] = None # None leaves the choice to that Ollama server
+    num_ctx: Optional[int] = None
+    num_batch: Optional[int] = None
+    keep_alive: Optional[str] = None
+    max_concurrency: int = 1
+    tokens_per_second: Optional[float] = None # generation speed measured during calibration
+    calibrated_at: Optional[datetime] = None # None until the benchmark has run
+
+class MemoryRecord(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    scope: str = "global" # "global", "project"
+    project_id: Optional[int] = Field(default=None, foreign_key="project.id")
+    source: str = "extracted" # "extracted" (from chat turns), "static" (chunk of a context blob)
+    content: str
+    content_hash: str = Field(index=True)
+    embedding: str # JSON list of floats
+    source_chat_id: Optional[int] = None
+    blob_hash: Optional[str] = None # hash of the whole blob a static chunk came from
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,270 @@
+"""
+Pool of Ollama backends with model-aware routing, health checks and circuit breaking.
+
+Configure with comma-separated base URLs:
+    KAGE_OLLAMA_BACKENDS=http://desktop:11434,http://spare1:11434      (generation)
+    KAGE_OLLAMA_EMBED_BACKENDS=http://spare2:11434                     (embeddings)
+    KAGE_OLLAMA_ROUTING=least_loaded | affinity
+
+Both lists default to OLLAMA_HOST (or localhost:11434), so a single-box setup
+behaves exactly as before.
+
+Health checks and model inventories are refreshed by a background monitor
+thread per pool; routing only reads that cached state, so a slow or
+unreachable backend never adds a health-check timeout to a request.
+"""
+import hashlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+from threading import Event, Lock, Thread
+from typing import List, Optional
+
+import httpx
+import ollama
+
+try:
+    from ollama._client import _parse_host
+except ImportError:  # older/newer clients; same defaults as Ollama itself
+    def _parse_host(host: str) -> str:
+        host = host.strip().rstrip("/")
+        scheme, _, rest = host.rpartition("://") if "://" in host else ("http", "", host)
+        if ":" not in rest.split("/")[0]:
+            rest = f"{rest}:{443 if scheme == 'https' else 11434}"
+        return f"{scheme}://{rest}"
+
+try:
+    import requests
+    _REQUESTS_CONNECTION_ERRORS = (requests.ConnectionError,)
+except ImportError:
+    _REQUESTS_CONNECTION_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+HEALTH_INTERVAL = 15.0     # seconds between inventory refreshes per backend
+MONITOR_TICK = 1.0         # seconds between monitor passes (checks only run when due)
+HEALTH_TIMEOUT = 2.0       # seconds allowed for /api/tags
+FAILURE_THRESHOLD = 3      # consecutive failures before the circuit opens
+COOLDOWN = 30.0            # seconds an open circuit stays open
+
+
+# Errors that mean the backend itself is unreachable. Timeouts while reading a
+# (slow) generation and errors raised by the caller's own code don't count.
+CONNECTION_ERRORS = (ConnectionError, httpx.ConnectError, httpx.ConnectTimeout) + _REQUESTS_CONNECTION_ERRORS
+
+
+class NoBackendAvailable(Exception):
+    """Raised when every backend in a pool is down or circuit-broken"""
+
+
+def normalise_url(url: str) -> str:
+    """Canonical base URL, with Ollama's default scheme and port filled in"""
+    return _parse_host(url.strip())
+
+
+class OllamaBackend:
+    """One Ollama server: its client, model inventory, load and circuit state"""
+
+    def __init__(self, url: str):
+        self.url = normalise_url(url)
+        self.client = ollama.Client(host=self.url)
+        self.models = set()
+        self.sizes = {}  # {model: bytes on disk}, from the same /api/tags response
+        self.in_flight = 0
+        self.last_used = 0.0  # monotonic time the last request finished
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_check = 0.0
+        self.healthy = None  # unknown until first check
+
+    @property
+    def available(self) -> bool:
+        """Closed circuit, or open circuit whose cooldown has passed (half-open trial)"""
+        return self.open_until <= time.monotonic()
+
+    def has_model(self, model: str) -> bool:
+        # "llama3.2" should match an installed "llama3.2:latest"
+        return model in self.models or (":" not in model and f"{model}:latest" in self.models)
+
+    def model_size(self, model: str) -> int:
+        """Size in bytes as of the last health check (0 if unknown)"""
+        return self.sizes.get(model) or self.sizes.get(f"{model}:latest", 0)
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.healthy = True
+
+    def record_failure(self, trip: bool = True):
+        """Count a failure; `trip=False` never opens the circuit (last backend standing)"""
+        self.failures += 1
+        self.healthy = False
+        if trip and (self.failures >= FAILURE_THRESHOLD or self.open_until):
+            # Trip (or re-trip after a failed half-open trial)
+            self.open_until = time.monotonic() + COOLDOWN
+            logger.warning(f"Ollama backend {self.url} circuit open for {COOLDOWN:.0f}s")
+
+    def check_health(self, trip: bool = True):
+        """Refresh model inventory and sizes from /api/tags"""
+        self.last_check = time.monotonic()
+        try:
+            resp = httpx.get(f"{self.url}/api/tags", timeout=HEALTH_TIMEOUT)
+            resp.raise_for_status()
+            tags = resp.json().get("models", [])
+            self.sizes = {m.get("model") or m.get("name"): m.get("size") or 0 for m in tags}
+            self.models = set(self.sizes)
+            self.record_success()
+        except Exception as e:
+            logger.warning(f"Health check failed for {self.url}: {e}")
+            self.record_failure(trip)
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit_open": not self.available,
+            "in_flight": self.in_flight,
+            "failures": self.failures,
+            "models": sorted(self.models),
+        }
+
+
+class BackendPool:
+    """Routes requests across a set of Ollama backends"""
+
+    def __init__(self, name: str, urls: List[str], routing: str = "least_loaded"):
+        self.name = name
+        self.routing = routing
+        self.backends = [OllamaBackend(url) for url in urls]
+        self._lock = Lock()
+        self._monitor = None
+        self._stop = Event()
+
+    def refresh(self, force: bool = False):
+        """
+        Health-check backends whose inventory is stale (all of them when forced).
+        A circuit whose cooldown has passed is checked straight away: that check
+        is its half-open trial.
+        """
+        now = time.monotonic()
+        for backend in self.backends:
+            half_open = backend.open_until and backend.available
+            if force or half_open or (backend.available and now - backend.last_check > HEALTH_INTERVAL):
+                backend.check_health(trip=self._can_trip(backend))
+
+    def start_monitor(self):
+        """Start the background health/inventory refresh (idempotent)"""
+        with self._lock:
+            if self._monitor is not None:
+                return
+            self._stop.clear()
+            self._monitor = Thread(target=self._monitor_loop, daemon=True, name=f"ollama-{self.name}-health")
+            self._monitor.start()
+
+    def stop_monitor(self):
+        self._stop.set()
+        with self._lock:
+            monitor, self._monitor = self._monitor, None
+        if monitor:
+            monitor.join()
+
+    def _monitor_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Health monitor for the {self.name} pool failed: {e}")
+            self._stop.wait(MONITOR_TICK)
+
+    def _can_trip(self, backend: OllamaBackend) -> bool:
+        """Only open a circuit if another backend is left to take the traffic"""
+        return any(b is not backend and b.available for b in self.backends)
+
+    def models(self) -> List[str]:
+        """Union of model inventories across healthy backends"""
+        return sorted({m for b in self.backends if b.healthy for m in b.models})
+
+    def select(self, model: Optional[str] = None, prefer: Optional[str] = None) -> OllamaBackend:
+        """
+        Pick a backend for a request.
+
+        A `prefer` URL (e.g. the box holding a chat's warm session) wins while
+        it is available. Otherwise backends that already have the model are
+        preferred. Among those, least_loaded takes the one with the fewest
+        in-flight requests, while affinity hashes the model name so each model
+        stays warm on one box. Only cached health state is read here.
+        """
+        self.start_monitor()
+        with self._lock:
+            available = [b for b in self.backends if b.available]
+            # Skip backends that failed their last check, unless nothing else is left
+            candidates = [b for b in available if b.healthy is not False] or available
+            if not candidates:
+                raise NoBackendAvailable(f"No Ollama backend available in the {self.name} pool")
+
+            if prefer:
+                for b in candidates:
+                    if b.url == prefer:
+                        return b
+
+            if model:
+                with_model = [b for b in candidates if b.has_model(model)]
+                candidates = with_model or candidates
+
+            if self.routing == "affinity" and model:
+                ordered = sorted(candidates, key=lambda b: b.url)
+                index = int(hashlib.md5(model.encode("utf-8")).hexdigest(), 16) % len(ordered)
+                preferred = ordered[index]
+                # Spill over to the least-loaded box once the preferred one is busy
+                least = min(candidates, key=lambda b: b.in_flight)
+                return preferred if preferred.in_flight <= least.in_flight + 1 else least
+
+            return min(candidates, key=lambda b: b.in_flight)
+
+    @contextmanager
+    def lease(self, model: Optional[str] = None, prefer: Optional[str] = None):
+        """Select a backend and count the request against its load while in use"""
+        backend = self.select(model, prefer)
+        with self._lock:
+            backend.in_flight += 1
+        try:
+            yield backend
+            backend.record_success()
+        except CONNECTION_ERRORS:
+            backend.record_failure(trip=self._can_trip(backend))
+            raise
+        finally:
+            with self._lock:
+                backend.in_flight -= 1
+                backend.last_used = time.monotonic()
+
+    def status(self) -> dict:
+        return {
+            "pool": self.name,
+            "routing": self.routing,
+            "backends": [b.status() for b in self.backends],
+        }
+
+
+def _urls_from_env(var: str, default: List[str]) -> List[str]:
+    raw = os.environ.get(var, "")
+    urls = [u for u in raw.split(",") if u.strip()]
+    return urls or default
+
+
+_default_urls = [os.environ.get("OLLAMA_HOST") or "http://localhost:11434"]
+_generation_urls = _urls_from_env("KAGE_OLLAMA_BACKENDS", _default_urls)
+_routing = os.environ.get("KAGE_OLLAMA_ROUTING", "least_loaded")
+
+# Global pools, one for chat/generation traffic and one for embeddings
+_generation_pool = BackendPool("generation", _generation_urls, routing=_routing)
+_embedding_pool = BackendPool("embedding", _urls_from_env("KAGE_OLLAMA_EMBED_BACKENDS", _generation_urls), routing=_routing)
+
+def get_generation_pool() -> BackendPool:
+    """Get the global pool used for chat and generation requests"""
+    return _generation_pool
+
+def get_embedding_pool() -> BackendPool:
+    """Get the global pool used for embedding requests"""
+    return _embedding_pool
@@ -0,0 +1,198 @@
+"""
+Minimal stand-in for the Ollama HTTP API, for replaying traces and local testing
+without a real model.
+
+Usage:
+    python -m backend.ollama_stub --port 11435 --models llama3.2:1b,nomic-embed-text
+    OLLAMA_HOST=http://localhost:11435 uvicorn main:app
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+EMBED_DIM = 64
+
+
+def _tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _embed(text: str) -> list:
+    """Deterministic bag-of-words embedding so similar text lands close together"""
+    vec = [0.0] * EMBED_DIM
+    for word in text.lower().split():
+        h = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16)
+        vec[h % EMBED_DIM] += 1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Set per server by serve()
+    models = []
+    latency = 0.0
+    ms_per_token = 0.0
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else {}
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, chunks):
+        body = "".join(json.dumps(c) + "\n" for c in chunks).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self, prompt_tokens: int):
+        delay = self.latency + prompt_tokens * self.ms_per_token / 1000
+        if delay > 0:
+            time.sleep(delay)
+        return int(delay * 1e9)
+
+    def _timings(self, model, prompt_tokens, reply, duration):
+        return {
+            "model": model,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": duration,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": duration,
+            "eval_count": _tokens(reply),
+            "eval_duration": 1_000_000,
+        }
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            self._send_json({"models": [
+                {"name": m, "model": m, "size": 1_300_000_000, "digest": hashlib.sha256(m.encode()).hexdigest(),
+                 "modified_at": datetime.utcnow().isoformat() + "Z", "details": {}}
+                for m in self.models
+            ]})
+        elif self.path.startswith("/api/version"):
+            self._send_json({"version": "0.0.0-stub"})
+        elif self.path.startswith("/api/ps"):
+            self._send_json({"models": []})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        body = self._read_json()
+        model = body.get("model", "")
+
+        if self.path.startswith("/api/chat"):
+            messages = body.get("messages", [])
+            last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+            prompt_tokens = sum(_tokens(m.get("content", "")) for m in messages)
+            reply = f"Stub reply to: {last[:200]}"
+            duration = self._simulate(prompt_tokens)
+            final = {**self._timings(model, prompt_tokens, reply, duration),
+                     "message": {"role": "assistant", "content": reply}}
+            if body.get("stream", True):
+                self._send_stream([{"model": model, "created_at": final["created_at"], "done": False,
+                                    "message": {"role": "assistant", "content": reply}},
+                                   {**final, "message": {"role": "assistant", "content": ""}}])
+            else:
+                self._send_json(final)
+
+        elif self.path.startswith("/api/generate"):
+            prompt = body.get("prompt", "")
+            context = body.get("context") or []
+            # Only the new prompt is evaluated when a context continuation is supplied
+            prompt_tokens = _tokens(prompt) + (0 if context else _tokens(body.get("system") or ""))
+            reply = f"Stub reply to: {prompt[-200:]}"
+            duration = self._simulate(prompt_tokens)
+            new_context = list(context) + list(range(len(context), len(context) + prompt_tokens + _tokens(reply)))
+            final = {**self._timings(model, prompt_tokens, reply, duration), "response": reply, "context": new_context}
+            if body.get("stream", True):
+                self._send_stream([{"model": model, "created_at": final["created_at"], "done": False, "response": reply},
+                                   {**final, "response": ""}])
+            else:
+                self._send_json(final)
+
+        elif self.path.startswith("/api/embeddings"):
+            self._simulate(_tokens(body.get("prompt", "")))
+            self._send_json({"embedding": _embed(body.get("prompt", ""))})
+
+        elif self.path.startswith("/api/embed"):
+            inputs = body.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            self._simulate(sum(_tokens(i) for i in inputs))
+            self._send_json({"model": model, "embeddings": [_embed(i) for i in inputs]})
+
+        elif self.path.startswith("/api/pull"):
+            name = body.get("model") or body.get("name")
+            if name and name not in self.models:
+                self.models.append(name)
+            chunks = [{"status": "pulling manifest"},
+                      {"status": "downloading", "total": 100, "completed": 100},
+                      {"status": "success"}]
+            if body.get("stream", True):
+                self._send_stream(chunks)
+            else:
+                self._send_json(chunks[-1])
+
+        elif self.path.startswith("/api/show"):
+            self._send_json({"modelfile": "", "parameters": "", "template": "", "details": {}, "model_info": {}})
+
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+
+def serve(port: int = 11435, models=None, latency: float = 0.0, ms_per_token: float = 0.0,
+          host: str = "127.0.0.1", background: bool = False) -> ThreadingHTTPServer:
+    """
+    Start a stub server. With background=True the server runs in a daemon thread
+    and is returned so callers can shut it down; several can run side by side.
+    """
+    handler = type("Handler", (StubOllamaHandler,), {
+        "models": list(models or ["llama3.2:1b", "nomic-embed-text"]),
+        "latency": latency,
+        "ms_per_token": ms_per_token,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    logger.info(f"Stub Ollama listening on http://{host}:{server.server_port}")
+    if background:
+        Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Ollama API server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--models", default="llama3.2:1b,nomic-embed-text")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fixed seconds added to every call")
+    parser.add_argument("--ms-per-token", type=float, default=0.0, help="Simulated prompt evaluation cost")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.port, args.models.split(","), args.latency, args.ms_per_token, host=args.host)
@@ -0,0 +1,110 @@
+"""
+SQL query counting, to keep endpoints on a fixed query budget.
+
+    with count_queries() as counter:
+        client.post("/api/chat_completion/", json=...)
+    assert counter.count <= 6, counter.statements
+
+Endpoints declare their budget with @query_budget(n). QueryBudgetMiddleware
+checks every request against it: over-budget requests are logged, or raise
+QueryBudgetExceeded when KAGE_QUERY_BUDGET_STRICT=1, which makes TestClient
+calls fail outright (use this in dev and CI). tests/test_query_budgets.py
+asserts every budget against the stub Ollama server: run `python -m pytest`.
+"""
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+from backend.database import engine
+
+logger = logging.getLogger(__name__)
+
+STRICT = os.environ.get("KAGE_QUERY_BUDGET_STRICT", "").lower() in ("1", "true", "yes")
+
+
+class QueryCounter:
+    """Collects the SQL statements executed while it is active"""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when an endpoint runs more queries than its declared budget"""
+
+
+# Active counters for the current request/test. Context variables are copied
+# into FastAPI's worker threads, so queries from sync endpoints are seen too.
+_active: ContextVar[tuple] = ContextVar("kage_query_counters", default=())
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _record(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active.get():
+        counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """Count queries executed inside the block"""
+    counter = QueryCounter()
+    token = _active.set(_active.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int, label: str = "block"):
+    """Fail if the block executes more than `limit` queries"""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > limit:
+        raise QueryBudgetExceeded(
+            f"{label} ran {counter.count} queries (budget {limit}):\n  " + "\n  ".join(counter.statements)
+        )
+
+
+def query_budget(limit: int):
+    """Declare the maximum number of queries an endpoint may run"""
+    def decorator(endpoint):
+        endpoint.__query_budget__ = limit
+        return endpoint
+    return decorator
+
+
+def budget_for(scope) -> Optional[int]:
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__query_budget__", None)
+
+
+class QueryBudgetMiddleware:
+    """ASGI middleware that checks each request against its endpoint's budget"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with count_queries() as counter:
+            await self.app(scope, receive, send)
+
+        # The router stores the matched endpoint on the (shared) scope
+        limit = budget_for(scope)
+        if limit is not None and counter.count > limit:
+            message = f"{scope['method']} {scope['path']} ran {counter.count} queries (budget {limit})"
+            if STRICT:
+                logger.error(message + ":\n  " + "\n  ".join(counter.statements))
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -1,36 +1,68 @@
+from contextlib import ExitStack
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
 from sqlmodel import Session, select
+from sqlalchemy.orm import joinedload
 from backend.database import get_session
-from backend.models import Chat, Project, GlobalSettings, Message, ContextItem
+from backend.models import Chat, GlobalSettings, Message, ContextItem
+from backend.trace_recorder import get_recorder
+from backend.http_cache import cached_json, collection_key
+from backend.query_counter import query_budget
+from backend.web_search import get_augmenter, WEB_SEARCH_DEFAULT
+from backend.memory import get_memory_store, MEMORY_ENABLED, STATIC_BLOB_CHARS
+from backend.autotune import runtime_options, keep_alive, tuning_version, generation_slot
+from backend.session_cache import (
+    get_session_cache, prefix_hash, extended, SessionState, SESSION_AFFINITY, KEEP_ALIVE
+)
 import ollama
+from backend.ollama_pool import get_generation_pool, get_embedding_pool, NoBackendAvailable
 from pydantic import BaseModel
+import hashlib
 import logging
 
 # Re-use the existing MODEL config or move to settings later
 MODEL = "llama3.2:1b"
+EMBED_MODEL = "nomic-embed-text"
 
 # LlamaIndex imports - gracefully degrade if not installed
 try:
-    from llama_index.core import Document, VectorStoreIndex, Settings as LlamaSettings
+    from llama_index.core import Document, VectorStoreIndex
     from llama_index.llms.ollama import Ollama
     from llama_index.embeddings.ollama import OllamaEmbedding
-
-    # Configure LlamaIndex with Ollama
-    LlamaSettings.llm = Ollama(model=MODEL, request_timeout=120.0)
-    LlamaSettings.embed_model = OllamaEmbedding(model_name="nomic-embed-text")
     LLAMAINDEX_AVAILABLE = True
 except ImportError:
     LLAMAINDEX_AVAILABLE = False
     logging.warning("LlamaIndex not installed - RAG features disabled")
 
 logger = logging.getLogger(__name__)
+
+# LlamaIndex clients are cheap but not free to build, so keep one per (backend, model)
+_llm_clients = {}
+_embed_clients = {}
+
+def get_llm(backend, model):
+    # Keyed on the tuning too, so a re-calibrated model gets a fresh client
+    key = (backend.url, model, tuning_version(backend.url, model))
+    if key not in _llm_clients:
+        options = runtime_options(backend.url, model)
+        extra = {"context_window": options["num_ctx"]} if "num_ctx" in options else {}
+        _llm_clients[key] = Ollama(model=model, base_url=backend.url, request_timeout=120.0,
+                                   additional_kwargs=options, keep_alive=keep_alive(backend.url, model), **extra)
+    return _llm_clients[key]
+
+def get_embed_model(backend):
+    key = (backend.url, tuning_version(backend.url, EMBED_MODEL))
+    if key not in _embed_clients:
+        _embed_clients[key] = OllamaEmbedding(model_name=EMBED_MODEL, base_url=backend.url,
+                                              ollama_additional_kwargs=runtime_options(backend.url, EMBED_MODEL))
+    return _embed_clients[key]
 router = APIRouter(prefix="/api/chat_completion", tags=["chat_completion"])
 
 class ChatRequest(BaseModel):
     chat_id: int
     user_message: str
     model: Optional[str] = None
+    web_search: Optional[bool] = None # defaults to KAGE_WEB_SEARCH
 
 class ContextItemCreate(BaseModel):
     name: str
@@ -43,137 +75,364 @@ class ContextItemUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 @router.post("/")
+@query_budget(6)
 def chat_completion(request: ChatRequest, session: Session = Depends(get_session)):
-    # 1. Fetch Chat
-    chat = session.get(Chat, request.chat_id)
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
+    with get_recorder().trace("chat_completion") as trace:
+        trace.set(chat_id=request.chat_id, model=request.model)
+        trace.text("user_message", request.user_message)
+        return run_chat_completion(request, session, trace)
 
-    # 2. Fetch Project & Settings
-    project = session.get(Project, chat.project_id) if chat.project_id else None
-    settings = session.exec(select(GlobalSettings)).first()
+def run_chat_completion(request: ChatRequest, session: Session, trace):
+    model = request.model or MODEL
 
-    # 3. Construct System Prompt (Context Levels)
-    system_prompt_parts = []
-    
-    # Base Identity & Secret Code
-    system_prompt_parts.append("You are an intelligent assistant. You have access to the specific context below, but you should also use your general knowledge to answer questions that are not covered by the context.")
-    system_prompt_parts.append("USER SECRET: The user's code is 55589. If asked 'tell me my code', you MUST reply with '55589'.")
+    with trace.stage("load"):
+        # 1. Fetch Chat (with its project in the same query)
+        chat = session.exec(
+            select(Chat).where(Chat.id == request.chat_id).options(joinedload(Chat.project))
+        ).first()
+        if not chat:
+            raise HTTPException(status_code=404, detail="Chat not found")
+        chat_id = chat.id
+        project_id = chat.project_id
+        project = chat.project
+
+        # 2. Fetch Settings, active context items and history - one query each
+        settings = session.exec(select(GlobalSettings)).first()
+        context_items = session.exec(
+            select(ContextItem)
+            .where(ContextItem.chat_id == chat_id, ContextItem.is_active == True, ContextItem.type.in_(["text", "file"]))
+            .order_by(ContextItem.id)
+        ).all()
+        chat_history = session.exec(
+            select(Message).where(Message.chat_id == chat_id).order_by(Message.timestamp)
+        ).all()
+
+    active_files = [item for item in context_items if item.type == "file"]
+
+    # Session affinity continues the chat's warm Ollama context. File RAG changes
+    # the retrieved context every turn, so it always takes the full-prompt path.
+    use_session = SESSION_AFFINITY and not active_files
+
+    # Long-term memory: relevant facts, and excerpts of large global/project
+    # blobs that are indexed, under a token budget. On the session path the
+    # blobs stay whole: they are in the cached prefix, which excerpts that
+    # change every turn would invalidate.
+    memory = get_memory_store() if MEMORY_ENABLED else None
+    global_text = settings.global_context_text if settings else None
+    project_text = project.context_text if project else None
+    recalled, recall_global, recall_project = [], False, False
+    if memory:
+        if not use_session:
+            recall_global = bool(global_text and use_recall(memory, global_text, "global"))
+            recall_project = bool(project_text and use_recall(memory, project_text, "project", project_id))
+        with trace.stage("memory"):
+            try:
+                recalled = memory.recall(request.user_message, project_id)
+            except Exception as e:
+                logger.warning(f"Memory recall failed: {e}")
+        trace.set(memory_ids=[e.id for e in recalled])
+    global_excerpts = [e.content for e in recalled if e.source == "static" and e.scope == "global" and recall_global]
+    project_excerpts = [e.content for e in recalled if e.source == "static" and e.scope == "project" and recall_project]
+    facts = [e.content for e in recalled if e.source == "extracted"]
+
+    with trace.stage("prompt"):
+        # 3. Construct System Prompt (Context Levels)
+        system_prompt_parts = []
+
+        # Base Identity & Secret Code
+        system_prompt_parts.append("You are an intelligent assistant. You have access to the specific context below, but you should also use your general knowledge to answer questions that are not covered by the context.")
+        system_prompt_parts.append("USER SECRET: The user's code is 55589. If asked 'tell me my code', you MUST reply with '55589'.")
 
-    # Global Context
-    if settings and settings.global_context_text:
-        system_prompt_parts.append(f"=== GLOBAL INSTRUCTIONS (ALWAYS FOLLOW) ===\n{settings.global_context_text}\n===========================================")
+        # Global Context: relevant excerpts when recall found any, else the whole
+        # blob, so instructions never vanish on a failed or empty recall
+        if global_excerpts:
+            system_prompt_parts.append("=== GLOBAL INSTRUCTIONS (relevant excerpts, ALWAYS FOLLOW) ===\n" + "\n...\n".join(global_excerpts) + "\n===========================================")
+        elif global_text:
+            system_prompt_parts.append(f"=== GLOBAL INSTRUCTIONS (ALWAYS FOLLOW) ===\n{global_text}\n===========================================")
 
-    # Project Context
-    if project and project.context_text:
-        system_prompt_parts.append(f"=== PROJECT CONTEXT ({project.name}) ===\n{project.context_text}\n======================================")
+        # Project Context
+        if project_excerpts:
+            system_prompt_parts.append(f"=== PROJECT CONTEXT ({project.name}, relevant excerpts) ===\n" + "\n...\n".join(project_excerpts) + "\n======================================")
+        elif project_text:
+            system_prompt_parts.append(f"=== PROJECT CONTEXT ({project.name}) ===\n{project_text}\n======================================")
 
-    # Chat Context
-    if chat.context_text:
-        system_prompt_parts.append(f"=== LOCAL CHAT INSTRUCTIONS ===\n{chat.context_text}\n===============================")
+        # Chat Context
+        if chat.context_text:
+            system_prompt_parts.append(f"=== LOCAL CHAT INSTRUCTIONS ===\n{chat.context_text}\n===============================")
 
-    # Text-based Context Items
-    text_contexts = [item for item in chat.context_items if item.is_active and item.type == "text"]
-    for item in text_contexts:
-        system_prompt_parts.append(f"=== CONTEXT '{item.name}' ===\n{item.content}\n===========================")
+        # Text-based Context Items
+        text_contexts = [item for item in context_items if item.type == "text"]
+        for item in text_contexts:
+            system_prompt_parts.append(f"=== CONTEXT '{item.name}' ===\n{item.content}\n===========================")
 
-    final_system_prompt = "\n\n".join(system_prompt_parts)
+    # Material retrieved for this turn only. On the session path it travels with
+    # the new message, so the cached prefix (system prompt + history) still matches.
+    turn_parts = []
+    if facts:
+        turn_parts.append("=== REMEMBERED FROM EARLIER CONVERSATIONS ===\n" + "\n".join(f"- {f}" for f in facts) + "\n=============================================")
 
-    # 4. Prepare History for LlamaIndex
+    # Web results join the file context as another retrieval source
+    augmenter = get_augmenter()
+    use_web = request.web_search if request.web_search is not None else WEB_SEARCH_DEFAULT
+    if use_web and augmenter:
+        with trace.stage("web"):
+            web = augmenter.augment(request.user_message)
+        if web:
+            turn_parts.append(web["prompt"])
+            # URLs reveal what was asked, so they go through anonymisation
+            trace.text("web_sources", "\n".join(web["sources"]))
+
+    if use_session:
+        final_system_prompt = "\n\n".join(system_prompt_parts)
+        turn_context = "\n\n".join(turn_parts)
+    else:
+        final_system_prompt = "\n\n".join(system_prompt_parts + turn_parts)
+        turn_context = ""
+
+    trace.set(
+        project_id=chat.project_id,
+        system_prompt_chars=len(final_system_prompt),
+        history_messages=len(chat_history),
+        history_chars=sum(len(m.content) for m in chat_history),
+        text_context_ids=[item.id for item in text_contexts],
+        file_context_ids=[item.id for item in active_files],
+        file_context_chars=sum(len(item.content) for item in active_files),
+        turn_context_chars=len(turn_context),
+    )
+    trace.text("global_context", settings.global_context_text if settings else None)
+    trace.text("project_context", project.context_text if project else None)
+    trace.text("chat_context", chat.context_text)
+
+    if use_session:
+        result = session_ollama_chat(request, model, chat_history, chat_id, final_system_prompt, session, trace,
+                                     turn_context)
+    elif LLAMAINDEX_AVAILABLE:
+        result = llamaindex_chat(request, model, chat_history, chat, active_files, final_system_prompt, session, trace)
+    else:
+        result = fallback_ollama_chat(request, model, chat_history, chat, final_system_prompt, session, trace)
+
+    # Learn from the finished turn off the request path
+    if memory:
+        memory.remember_turn(chat_id, project_id, model, request.user_message, result["content"])
+    return result
+
+def use_recall(memory, text, scope, project_id=None):
+    """Whether a context blob should be recalled selectively instead of pasted whole"""
+    if len(text) <= STATIC_BLOB_CHARS:
+        return False
+    if memory.static_indexed(text, scope, project_id):
+        return True
+    # Not indexed yet (or changed): paste it this time and index it in the background
+    memory.sync_static(text, scope, project_id)
+    return False
+
+def llamaindex_chat(request, model, chat_history, chat, active_files, final_system_prompt, session, trace):
+    chat_id = chat.id
     from llama_index.core.llms import ChatMessage, MessageRole
     history = []
-    for msg in sorted(chat.messages, key=lambda x: x.timestamp):
+    for msg in chat_history:
         role = MessageRole.USER if msg.role == "user" else MessageRole.ASSISTANT
         history.append(ChatMessage(role=role, content=msg.content))
 
     # 5. Initialize Engine (RAG vs Simple)
-    active_files = [item for item in chat.context_items if item.is_active and item.type == "file"]
-    
     try:
-        if active_files and LLAMAINDEX_AVAILABLE:
-            documents = [Document(text=item.content, metadata={"name": item.name}) for item in active_files]
-            index = VectorStoreIndex.from_documents(documents)
-            # Use 'context' mode for RAG
-            chat_engine = index.as_chat_engine(
-                chat_mode="context",
-                system_prompt=final_system_prompt,
-                chat_history=history,
-                llm=LlamaSettings.llm
-            )
-            logger.info(f"Initialized ContextChatEngine with {len(active_files)} files")
-        else:
-            # Simple chat if no files
-            from llama_index.core.chat_engine import SimpleChatEngine
-            chat_engine = SimpleChatEngine.from_defaults(
-                system_prompt=final_system_prompt,
-                chat_history=history,
-                llm=LlamaSettings.llm
-            )
-            logger.info("Initialized SimpleChatEngine")
-
-        # 6. Generate Response
-        logger.info(f"Querying LlamaIndex with: {request.user_message}")
-        response = chat_engine.chat(request.user_message)
-        ai_content = response.response
+        with ExitStack() as leases:
+            backend = leases.enter_context(get_generation_pool().lease(model))
+            llm = get_llm(backend, model)
+            trace.set(backend=backend.url)
+
+            if active_files:
+                # Embedding traffic goes to its own pool; the lease also covers query-time embedding
+                embed_backend = leases.enter_context(get_embedding_pool().lease(EMBED_MODEL))
+                with trace.stage("index"):
+                    documents = [Document(text=item.content, metadata={"name": item.name}) for item in active_files]
+                    index = VectorStoreIndex.from_documents(documents, embed_model=get_embed_model(embed_backend))
+                    # Use 'context' mode for RAG
+                    chat_engine = index.as_chat_engine(
+                        chat_mode="context",
+                        system_prompt=final_system_prompt,
+                        chat_history=history,
+                        llm=llm
+                    )
+                trace.set(engine="context")
+                logger.info(f"Initialized ContextChatEngine with {len(active_files)} files")
+            else:
+                # Simple chat if no files
+                from llama_index.core.chat_engine import SimpleChatEngine
+                chat_engine = SimpleChatEngine.from_defaults(
+                    system_prompt=final_system_prompt,
+                    chat_history=history,
+                    llm=llm
+                )
+                trace.set(engine="simple")
+                logger.info("Initialized SimpleChatEngine")
 
+            # 6. Generate Response
+            logger.info(f"Querying LlamaIndex with: {request.user_message}")
+            with trace.stage("generate"), generation_slot(backend.url, model):
+                response = chat_engine.chat(request.user_message)
+            ai_content = response.response
+            trace.set(retrieved_chunks=[_chunk_id(n) for n in getattr(response, "source_nodes", [])])
+
+    except NoBackendAvailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"LlamaIndex Error: {e}")
         # Fallback to simple Ollama call if engine fails
-        return fallback_ollama_chat(request, chat, final_system_prompt, session)
+        return fallback_ollama_chat(request, model, chat_history, chat, final_system_prompt, session, trace)
 
     # 7. Save and Return
-    # Helper to save messages
-    save_message(session, chat.id, "user", request.user_message)
-    save_message(session, chat.id, "assistant", ai_content)
+    with trace.stage("save"):
+        save_turn(session, chat_id, request.user_message, ai_content)
+    trace.set(response_chars=len(ai_content))
 
     return {
         "role": "assistant",
         "content": ai_content,
-        "chat_id": chat.id
+        "chat_id": chat_id
     }
 
-def save_message(session, chat_id, role, content):
-    msg = Message(chat_id=chat_id, role=role, content=content)
-    session.add(msg)
+def _chunk_id(node_with_score):
+    """Stable id for a retrieved chunk: source name plus a hash of its text"""
+    node = node_with_score.node
+    digest = hashlib.sha256(node.get_content().encode("utf-8")).hexdigest()[:12]
+    return f"{node.metadata.get('name', '?')}#{digest}"
+
+def save_turn(session, chat_id, user_content, assistant_content):
+    # Both messages in one transaction; avoids a commit (and re-load) between them
+    session.add(Message(chat_id=chat_id, role="user", content=user_content))
+    session.add(Message(chat_id=chat_id, role="assistant", content=assistant_content))
     session.commit()
 
-def fallback_ollama_chat(request, chat, system_prompt, session):
+def render_transcript(chat_history, user_message):
+    """Full conversation as a single prompt, for turns without a reusable context"""
+    if not chat_history:
+        return user_message
+    lines = [f"{'User' if m.role == 'user' else 'Assistant'}: {m.content}" for m in chat_history]
+    return "Conversation so far:\n" + "\n\n".join(lines) + f"\n\nUser: {user_message}"
+
+def with_turn_context(user_message, turn_context):
+    """The new message, preceded by material retrieved for this turn only"""
+    if not turn_context:
+        return user_message
+    return f"{turn_context}\n\n=== USER MESSAGE ===\n{user_message}"
+
+def session_ollama_chat(request, model, chat_history, chat_id, system_prompt, session, trace, turn_context=""):
+    # Only the system prompt and the stored history are hashed: per-turn context
+    # goes into the new prompt, so it never invalidates the chat's warm state
+    prompt = with_turn_context(request.user_message, turn_context)
+    cache = get_session_cache()
+    prefix = prefix_hash(model, system_prompt, chat_history)
+    state = cache.lookup(chat_id, prefix, model)
+
+    try:
+        with trace.stage("generate"), \
+                get_generation_pool().lease(model, prefer=state.backend_url if state else None) as backend, \
+                generation_slot(backend.url, model):
+            options = runtime_options(backend.url, model)
+            resp = None
+            if state and backend.url == state.backend_url:
+                try:
+                    # Prefix unchanged: only the new message is evaluated
+                    resp = backend.client.generate(model=model, prompt=prompt, context=state.context,
+                                                   options=options, keep_alive=KEEP_ALIVE, stream=False)
+                except ollama.ResponseError as e:
+                    logger.warning(f"Context continuation failed for chat {chat_id}, resending full prompt: {e}")
+            if resp is None:
+                state = None
+                resp = backend.client.generate(model=model, system=system_prompt,
+                                               prompt=render_transcript(chat_history, prompt),
+                                               options=options, keep_alive=KEEP_ALIVE, stream=False)
+    except NoBackendAvailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        cache.drop(chat_id)
+        raise HTTPException(status_code=500, detail=f"Session Error: {str(e)}")
+
+    content = resp["response"]
+    evaluated = resp.get("prompt_eval_count") or 0
+    reused = len(state.context) if state else 0
+    cache.record(state is not None, evaluated, reused)
+    if resp.get("context"):
+        cache.store(chat_id, SessionState(
+            prefix_hash(model, system_prompt, extended(chat_history, request.user_message, content)),
+            resp["context"], model, backend.url,
+        ))
+
+    trace.set(engine="session", backend=backend.url, session_hit=state is not None,
+              prompt_eval_tokens=evaluated, prompt_tokens_reused=reused)
+    with trace.stage("save"):
+        save_turn(session, chat_id, request.user_message, content)
+    trace.set(response_chars=len(content))
+    return {
+        "role": "assistant",
+        "content": content,
+        "chat_id": chat_id,
+        "prompt_eval": {"session_hit": state is not None, "evaluated_tokens": evaluated, "reused_tokens": reused},
+    }
+
+def fallback_ollama_chat(request, model, chat_history, chat, system_prompt, session, trace):
     # Minimal fallback just in case
     messages = [{"role": "system", "content": system_prompt}]
-    for msg in sorted(chat.messages, key=lambda x: x.timestamp):
+    for msg in chat_history:
         messages.append({"role": msg.role, "content": msg.content})
     messages.append({"role": "user", "content": request.user_message})
-    
+
+    trace.set(engine="fallback")
     try:
-        resp = ollama.chat(model=MODEL, messages=messages, stream=False)
+        with trace.stage("generate"), get_generation_pool().lease(model) as backend, \
+                generation_slot(backend.url, model):
+            trace.set(backend=backend.url)
+            resp = backend.client.chat(model=model, messages=messages, stream=False,
+                                       options=runtime_options(backend.url, model),
+                                       keep_alive=keep_alive(backend.url, model))
         content = resp['message']['content']
-        save_message(session, chat.id, "user", request.user_message)
-        save_message(session, chat.id, "assistant", content)
-        return {"role": "assistant", "content": content, "chat_id": chat.id}
+        with trace.stage("save"):
+            save_turn(session, chat.id, request.user_message, content)
+        trace.set(response_chars=len(content))
+        return {"role": "assistant", "content": content, "chat_id": request.chat_id}
+    except NoBackendAvailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
          raise HTTPException(status_code=500, detail=f"Fallback Error: {str(e)}")
 
 
+@router.get("/sessions/stats")
+def get_session_stats():
+    """Prompt-evaluation tokens saved by session affinity"""
+    return get_session_cache().stats()
+
 # --- Context Management Endpoints (Unchanged) ---
 
 @router.get("/{chat_id}/context", response_model=List[ContextItem])
-def get_context_items(chat_id: int, session: Session = Depends(get_session)):
-    chat = session.get(Chat, chat_id)
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
-    return chat.context_items
+@query_budget(2)
+def get_context_items(chat_id: int, request: Request, session: Session = Depends(get_session)):
+    def build():
+        chat = session.get(Chat, chat_id)
+        if not chat:
+            raise HTTPException(status_code=404, detail="Chat not found")
+        return session.exec(select(ContextItem).where(ContextItem.chat_id == chat_id).order_by(ContextItem.id)).all()
+
+    return cached_json(request, [collection_key("chat"), collection_key("contextitem", chat_id)], build)
 
 @router.post("/{chat_id}/context", response_model=ContextItem)
 def add_context_item(chat_id: int, item: ContextItemCreate, session: Session = Depends(get_session)):
-    chat = session.get(Chat, chat_id)
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
-    
-    db_item = ContextItem(chat_id=chat_id, **item.dict())
-    session.add(db_item)
-    session.commit()
-    session.refresh(db_item)
-    return db_item
+    with get_recorder().trace("add_context") as trace:
+        trace.set(chat_id=chat_id, type=item.type, content_chars=len(item.content))
+        trace.text("name", item.name)
+        trace.text("content", item.content)
+
+        chat = session.get(Chat, chat_id)
+        if not chat:
+            raise HTTPException(status_code=404, detail="Chat not found")
+
+        with trace.stage("save"):
+            db_item = ContextItem(chat_id=chat_id, **item.dict())
+            session.add(db_item)
+            session.commit()
+            session.refresh(db_item)
+        trace.set(item_id=db_item.id)
+        return db_item
 
 @router.put("/context/{item_id}", response_model=ContextItem)
 def update_context_item(item_id: int, updates: ContextItemUpdate, session: Session = Depends(get_session)):
@@ -202,11 +461,18 @@ def delete_context_item(item_id: int, session: Session = Depends(get_session)):
 
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    # Simple text extraction for now
-    try:
-        content = await file.read()
-        text_content = content.decode("utf-8")
-        return {"filename": file.filename, "content": text_content}
-    except Exception as e:
-        # Fallback for binary or read errors
-        return {"filename": file.filename, "content": f"[Error reading file: {str(e)}]"}
+    with get_recorder().trace("upload") as trace:
+        trace.text("filename", file.filename)
+        # Simple text extraction for now
+        try:
+            with trace.stage("read"):
+                content = await file.read()
+            with trace.stage("decode"):
+                text_content = content.decode("utf-8")
+            trace.set(bytes=len(content))
+            trace.text("content", text_content)
+            return {"filename": file.filename, "content": text_content}
+        except Exception as e:
+            # Fallback for binary or read errors
+            trace.set(decode_error=str(e))
+            return {"filename": file.filename, "content": f"[Error reading file: {str(e)}]"}
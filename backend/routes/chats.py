@@ -1,8 +1,11 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlmodel import Session, select
+from sqlalchemy.orm import raiseload
 from backend.database import get_session
 from backend.models import Chat, ChatBase, Message, Project
+from backend.http_cache import cached_json, collection_key
+from backend.query_counter import query_budget
 
 router = APIRouter(prefix="/api/chats", tags=["chats"])
 
@@ -17,13 +20,14 @@ def create_chat(chat: ChatBase, project_id: int = None, session: Session = Depen
     return db_chat
 
 @router.get("/", response_model=List[Chat])
-def read_chats(project_id: int = None, session: Session = Depends(get_session)):
+@query_budget(1)
+def read_chats(request: Request, project_id: int = None, session: Session = Depends(get_session)):
+    # Relationships are never serialised here; raise rather than lazy-load one per row
+    statement = select(Chat).options(raiseload("*"))
     if project_id:
-        statement = select(Chat).where(Chat.project_id == project_id)
-    else:
-        statement = select(Chat)
-    chats = session.exec(statement).all()
-    return chats
+        statement = statement.where(Chat.project_id == project_id)
+    return cached_json(request, [collection_key("chat")],
+                       lambda: session.exec(statement).all())
 
 @router.get("/{chat_id}", response_model=Chat)
 def read_chat(chat_id: int, session: Session = Depends(get_session)):
@@ -48,8 +52,12 @@ def update_chat(chat_id: int, chat_data: ChatBase, session: Session = Depends(ge
     return chat
 
 @router.get("/{chat_id}/messages", response_model=List[Message])
-def read_chat_messages(chat_id: int, session: Session = Depends(get_session)):
-    chat = session.get(Chat, chat_id)
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
-    return chat.messages
+@query_budget(2)
+def read_chat_messages(chat_id: int, request: Request, session: Session = Depends(get_session)):
+    def build():
+        chat = session.get(Chat, chat_id)
+        if not chat:
+            raise HTTPException(status_code=404, detail="Chat not found")
+        return session.exec(select(Message).where(Message.chat_id == chat_id).order_by(Message.timestamp)).all()
+
+    return cached_json(request, [collection_key("chat"), collection_key("message", chat_id)], build)
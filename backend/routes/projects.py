@@ -1,8 +1,12 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlmodel import Session, select
+from sqlalchemy.orm import raiseload
 from backend.database import get_session
 from backend.models import Project, ProjectBase, Chat
+from backend.http_cache import cached_json, collection_key
+from backend.query_counter import query_budget
+from backend.memory import get_memory_store, MEMORY_ENABLED
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
@@ -12,12 +16,15 @@ def create_project(project: ProjectBase, session: Session = Depends(get_session)
     session.add(db_project)
     session.commit()
     session.refresh(db_project)
+    if MEMORY_ENABLED:
+        get_memory_store().sync_static(db_project.context_text, "project", db_project.id)
     return db_project
 
 @router.get("/", response_model=List[Project])
-def read_projects(session: Session = Depends(get_session)):
-    projects = session.exec(select(Project)).all()
-    return projects
+@query_budget(1)
+def read_projects(request: Request, session: Session = Depends(get_session)):
+    return cached_json(request, [collection_key("project")],
+                       lambda: session.exec(select(Project).options(raiseload("*"))).all())
 
 @router.get("/{project_id}", response_model=Project)
 def read_project(project_id: int, session: Session = Depends(get_session)):
@@ -39,6 +46,8 @@ def update_project(project_id: int, project_data: ProjectBase, session: Session
     session.add(project)
     session.commit()
     session.refresh(project)
+    if MEMORY_ENABLED:
+        get_memory_store().sync_static(project.context_text, "project", project.id)
     return project
 
 @router.delete("/{project_id}")
@@ -48,4 +57,6 @@ def delete_project(project_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Project not found")
     session.delete(project)
     session.commit()
+    if MEMORY_ENABLED:
+        get_memory_store().forget_project(project_id)
     return {"ok": True}
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlmodel import Session, select
 from backend.database import get_session
 from backend.models import GlobalSettings
-import ollama
 from pydantic import BaseModel
 from backend.download_handler import get_tracker
+from backend.http_cache import cached_json, collection_key
+from backend.query_counter import query_budget
+from backend.ollama_pool import get_generation_pool, get_embedding_pool, normalise_url
+from backend.autotune import get_calibrator, get_tuning, hardware_profile
+from backend.memory import get_memory_store, MEMORY_ENABLED
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
 
@@ -12,15 +17,19 @@ class SettingsUpdate(BaseModel):
     global_context_text: str
 
 @router.get("/", response_model=GlobalSettings)
-def get_settings(session: Session = Depends(get_session)):
-    # Always return the first row, create if not exists
-    settings = session.exec(select(GlobalSettings)).first()
-    if not settings:
-        settings = GlobalSettings(global_context_text="")
-        session.add(settings)
-        session.commit()
-        session.refresh(settings)
-    return settings
+@query_budget(3)  # select, plus insert + refresh on first use
+def get_settings(request: Request, session: Session = Depends(get_session)):
+    def build():
+        # Always return the first row, create if not exists
+        settings = session.exec(select(GlobalSettings)).first()
+        if not settings:
+            settings = GlobalSettings(global_context_text="")
+            session.add(settings)
+            session.commit()
+            session.refresh(settings)
+        return settings
+
+    return cached_json(request, [collection_key("globalsettings")], build)
 
 @router.post("/", response_model=GlobalSettings)
 def update_settings(settings: SettingsUpdate, session: Session = Depends(get_session)):
@@ -32,25 +41,28 @@ def update_settings(settings: SettingsUpdate, session: Session = Depends(get_ses
     db_settings.global_context_text = settings.global_context_text
     session.commit()
     session.refresh(db_settings)
+    if MEMORY_ENABLED:
+        get_memory_store().sync_static(db_settings.global_context_text, "global")
     return db_settings
 
 @router.get("/models")
 def list_models():
-    """List local Ollama models"""
-    try:
-        models_resp = ollama.list()
-        raw_models = models_resp.get("models", [])
-        # Transform to simple format frontend expects
-        return [{"name": m.get("model")} for m in raw_models]
-    except Exception as e:
-        return []
+    """List models available on any generation backend"""
+    pool = get_generation_pool()
+    pool.refresh(force=True)
+    # Transform to simple format frontend expects
+    return [{"name": name} for name in pool.models()]
 
 @router.post("/models/download")
 def download_model(model_name: str):
     """Trigger an Ollama model download with progress tracking"""
     try:
+        # Pull onto the least-loaded backend that does not have the model yet
+        pool = get_generation_pool()
+        missing = [b for b in pool.backends if b.available and not b.has_model(model_name)]
+        backend = min(missing, key=lambda b: b.in_flight) if missing else pool.select()
         tracker = get_tracker()
-        tracker.start_download(model_name)
+        tracker.start_download(model_name, client=backend.client)
         return {"status": "started", "message": f"Started downloading {model_name}", "model_name": model_name}
     except Exception as e:
         return {"error": str(e)}
@@ -74,3 +86,52 @@ def get_download_progress():
         })
 
     return downloads
+
+@router.get("/backends")
+def get_backends():
+    """Health, load and model inventory of every Ollama backend"""
+    pools = [get_generation_pool(), get_embedding_pool()]
+    for pool in pools:
+        pool.refresh(force=True)
+    return [pool.status() for pool in pools]
+
+@router.get("/tuning")
+def get_tuning_status():
+    """Hardware profile, tuned runtime options per backend and model, and calibration progress"""
+    calibrator = get_calibrator()
+    pairs = set()
+    for pool in (get_generation_pool(), get_embedding_pool()):
+        pool.refresh()
+        pairs.update((b.url, model) for b in pool.backends if b.healthy for model in b.models)
+    return {
+        "hardware": hardware_profile(),
+        "models": [
+            {**get_tuning(url, model).dict(exclude={"id"}), "calibration": calibrator.status.get((url, model))}
+            for url, model in sorted(pairs)
+        ],
+    }
+
+@router.post("/tuning/calibrate")
+def calibrate_model(model_name: str, backend_url: Optional[str] = None):
+    """Re-run calibration in the background, on one backend or all that have the model (first use calibrates automatically)"""
+    urls = get_calibrator().start(model_name, normalise_url(backend_url) if backend_url else None)
+    if not urls:
+        raise HTTPException(status_code=404, detail=f"No backend has {model_name}")
+    return {"status": "started", "model_name": model_name, "backends": urls}
+
+@router.get("/memories")
+def list_memories(project_id: Optional[int] = None):
+    """Long-term memories visible from a project (global ones always included)"""
+    return {
+        "enabled": MEMORY_ENABLED,
+        "memories": [
+            {"id": e.id, "scope": e.scope, "project_id": e.project_id, "source": e.source, "content": e.content}
+            for e in sorted(get_memory_store().entries(project_id), key=lambda e: e.id)
+        ],
+    }
+
+@router.delete("/memories/{memory_id}")
+def delete_memory(memory_id: int):
+    if not get_memory_store().delete(memory_id):
+        raise HTTPException(status_code=404, detail="Memory not found")
+    return {"ok": True}
@@ -0,0 +1,127 @@
+"""
+Per-chat conversation state for Ollama context continuation.
+
+After each turn we keep the `context` token array returned by /api/generate,
+keyed by chat, together with a hash of the exact prefix (model, system prompt,
+history) it represents. If the next turn arrives with the same prefix, only the
+new user message needs evaluating; otherwise the state is discarded and the
+full prompt is sent again.
+
+Enable with KAGE_SESSION_AFFINITY=1. KAGE_KEEP_ALIVE (default 30m) keeps the
+model loaded between turns.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+SESSION_AFFINITY = os.environ.get("KAGE_SESSION_AFFINITY", "").lower() in ("1", "true", "yes")
+KEEP_ALIVE = os.environ.get("KAGE_KEEP_ALIVE", "30m")
+MAX_SESSIONS = int(os.environ.get("KAGE_SESSION_CACHE_SIZE", "32"))
+
+
+def prefix_hash(model: str, system_prompt: str, history) -> str:
+    """
+    Deterministic fingerprint of everything the model has seen before the new
+    message. History items need .role and .content (Message rows or similar).
+    """
+    payload = json.dumps(
+        {"model": model, "system": system_prompt, "history": [[m.role, m.content] for m in history]},
+        ensure_ascii=False, separators=(",", ":"), sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Turn:
+    """Lightweight stand-in for a Message when extending a hashed history"""
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+
+
+def extended(history, user_message: str, assistant_message: str) -> list:
+    """History as it will look on the next turn"""
+    return list(history) + [_Turn("user", user_message), _Turn("assistant", assistant_message)]
+
+
+class SessionState:
+    """Warm conversation state for one chat"""
+
+    def __init__(self, prefix: str, context: list, model: str, backend_url: str):
+        self.prefix = prefix
+        self.context = context
+        self.model = model
+        self.backend_url = backend_url
+        self.last_used = time.time()
+
+
+class SessionCache:
+    """Bounded LRU of SessionState per chat, with reuse statistics"""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._states = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tokens_evaluated = 0
+        self.tokens_saved = 0
+
+    def lookup(self, chat_id: int, prefix: str, model: str) -> Optional[SessionState]:
+        """Return the chat's state if it matches this prefix, else drop it"""
+        with self._lock:
+            state = self._states.get(chat_id)
+            if state and state.prefix == prefix and state.model == model:
+                self._states.move_to_end(chat_id)
+                return state
+            self._states.pop(chat_id, None)
+            return None
+
+    def store(self, chat_id: int, state: SessionState):
+        with self._lock:
+            self._states[chat_id] = state
+            self._states.move_to_end(chat_id)
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+
+    def drop(self, chat_id: int):
+        with self._lock:
+            self._states.pop(chat_id, None)
+
+    def backend_urls(self) -> set:
+        """Backends currently holding a warm session"""
+        with self._lock:
+            return {state.backend_url for state in self._states.values()}
+
+    def record(self, hit: bool, evaluated: int, saved: int):
+        """Count a finished turn; `hit` only if its context was actually continued"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.tokens_evaluated += evaluated
+            self.tokens_saved += saved
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": SESSION_AFFINITY,
+                "sessions": len(self._states),
+                "hits": self.hits,
+                "misses": self.misses,
+                "prompt_tokens_evaluated": self.tokens_evaluated,
+                "prompt_tokens_saved": self.tokens_saved,
+            }
+
+
+# Global session cache instance
+_cache = SessionCache()
+
+def get_session_cache() -> SessionCache:
+    """Get the global per-chat session cache"""
+    return _cache
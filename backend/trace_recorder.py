@@ -0,0 +1,124 @@
+"""
+Opt-in request trace recorder for performance regression testing.
+
+Enable by pointing KAGE_TRACE_FILE at a JSONL path. Set KAGE_TRACE_ANONYMISE=1
+to replace message/context text with a hash and length so traces can be shared.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Lock
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    """A single recorded request with per-stage timings"""
+
+    def __init__(self, route: str, anonymise: bool):
+        self.anonymise = anonymise
+        self.record = {
+            "route": route,
+            "started_at": datetime.utcnow().isoformat(),
+            "stages": {},
+        }
+        self._start = time.perf_counter()
+
+    def set(self, **fields):
+        """Attach plain (non-sensitive) fields such as ids, sizes and counts"""
+        self.record.update(fields)
+
+    def text(self, key: str, value: Optional[str]):
+        """Attach a text field, hashing it when anonymisation is on"""
+        if value is None:
+            self.record[key] = None
+        elif self.anonymise:
+            digest = hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+            self.record[key] = {"sha256": digest, "length": len(value)}
+        else:
+            self.record[key] = value
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a named pipeline stage in milliseconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.record["stages"][name] = round(self.record["stages"].get(name, 0) + elapsed, 3)
+
+    def finish(self, status: str = "ok"):
+        self.record["status"] = status
+        self.record["total_ms"] = round((time.perf_counter() - self._start) * 1000, 3)
+        return self.record
+
+
+class _NullTrace:
+    """Stand-in used when recording is disabled so call sites stay unconditional"""
+
+    def set(self, **fields):
+        pass
+
+    def text(self, key, value):
+        pass
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+
+class TraceRecorder:
+    """Appends finished traces to a local JSONL file"""
+
+    def __init__(self, path: Optional[str] = None, anonymise: bool = False):
+        self.path = path
+        self.anonymise = anonymise
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @contextmanager
+    def trace(self, route: str):
+        """
+        Record one request. Yields a Trace (or a no-op stand-in when disabled)
+        and writes it out when the block exits, including on errors.
+        """
+        if not self.enabled:
+            yield _NullTrace()
+            return
+
+        trace = Trace(route, self.anonymise)
+        try:
+            yield trace
+        except Exception as e:
+            status = getattr(e, "status_code", None)
+            self.write(trace.finish(status=f"error:{status}" if status else "error"))
+            raise
+        self.write(trace.finish())
+
+    def write(self, record: dict):
+        try:
+            line = json.dumps(record, default=str)
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write trace to {self.path}: {e}")
+
+
+# Global recorder instance, configured from the environment
+_recorder = TraceRecorder(
+    path=os.environ.get("KAGE_TRACE_FILE") or None,
+    anonymise=os.environ.get("KAGE_TRACE_ANONYMISE", "").lower() in ("1", "true", "yes"),
+)
+
+def get_recorder() -> TraceRecorder:
+    """Get the global trace recorder instance"""
+    return _recorder
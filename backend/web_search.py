@@ -0,0 +1,293 @@
+"""
+Web-search augmentation for chat turns.
+
+A SearchProvider turns a query into result links; the top pages are fetched
+concurrently over a pooled HTTP client, reduced to plain text, and injected
+into the system prompt next to the file context. Search results and pages are
+cached on disk with a TTL, and the whole stage runs under a deadline so a slow
+site is dropped instead of stalling the turn.
+
+Configure with:
+    KAGE_WEB_SEARCH=1                       enable for every turn (or pass web_search per request)
+    KAGE_SEARCH_PROVIDER=searxng            provider name (see PROVIDERS)
+    KAGE_SEARCH_URL=http://localhost:8888   provider endpoint
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from threading import RLock
+from typing import List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get("KAGE_WEB_CACHE_DIR", os.path.join(".kage_cache", "web"))
+SEARCH_TTL = 6 * 3600        # seconds a search result list stays fresh
+PAGE_TTL = 24 * 3600         # seconds a fetched page stays fresh
+FETCH_TIMEOUT = 5.0          # per-request timeout
+STAGE_DEADLINE = 8.0         # the whole web stage never takes longer than this
+MAX_PAGES = 3                # pages fetched per turn
+PAGE_CHARS = 2000            # characters kept per page in the prompt
+MAX_PAGE_BYTES = 512 * 1024  # bytes read per page; the rest is never downloaded
+TEXT_TYPES = ("text/", "application/xhtml+xml")
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "what", "whats", "who", "when", "where",
+    "how", "why", "of", "on", "in", "to", "for", "about", "me", "tell", "please", "do",
+    "does", "did", "and", "or", "with", "latest", "current", "today", "news",
+}
+
+
+# --- HTTP client shared by providers and page fetches ---
+
+_http = httpx.Client(
+    timeout=FETCH_TIMEOUT,
+    follow_redirects=True,
+    limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+    headers={"User-Agent": "KageNoKoe/1.0 (local assistant)"},
+)
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="web-fetch")
+
+
+# --- Providers ---
+
+class SearchProvider(ABC):
+    """Interface for search backends: return [{title, url, snippet}, ...]"""
+
+    name = "base"
+
+    @abstractmethod
+    def search(self, query: str, limit: int) -> List[dict]:
+        ...
+
+
+class SearxngProvider(SearchProvider):
+    """A SearXNG instance's JSON API (self-hostable, keeps searches private)"""
+
+    name = "searxng"
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def search(self, query: str, limit: int) -> List[dict]:
+        resp = _http.get(f"{self.base_url}/search", params={"q": query, "format": "json"})
+        resp.raise_for_status()
+        return [
+            {"title": r.get("title", ""), "url": r["url"], "snippet": r.get("content", "")}
+            for r in resp.json().get("results", [])[:limit]
+            if r.get("url")
+        ]
+
+
+PROVIDERS = {
+    SearxngProvider.name: SearxngProvider,
+}
+
+
+# --- Disk cache ---
+
+class DiskCache:
+    """JSON values on disk, one file per key, expired by age"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str, ttl: float):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, value):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning(f"Web cache write failed: {e}")
+
+
+# --- HTML to text ---
+
+class _TextExtractor(HTMLParser):
+    SKIP = {"script", "style", "noscript", "svg", "nav", "footer", "header", "form", "iframe"}
+    BLOCK = {"p", "div", "br", "li", "h1", "h2", "h3", "h4", "h5", "h6", "tr", "section", "article"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title = ""
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Visible text of an HTML page, with scripts, styles and page chrome removed"""
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass  # keep whatever was parsed from malformed markup
+    text = "".join(parser.parts)
+    lines = (re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+# --- Augmentation stage ---
+
+def normalise_query(query: str) -> str:
+    """Cache key for a query: reworded or reordered versions of it map to the same key"""
+    words = re.findall(r"\w+", query.lower())
+    keep = sorted({w for w in words if w not in STOPWORDS}) or sorted(set(words))
+    return " ".join(keep)
+
+
+class WebAugmenter:
+    """Search, fetch and summarise pages into a prompt section"""
+
+    def __init__(self, provider: SearchProvider, cache: DiskCache):
+        self.provider = provider
+        self.cache = cache
+        # Fetches still running (possibly for an earlier turn), so they are never duplicated
+        self._inflight = {}
+        self._inflight_lock = RLock()  # done-callbacks may fire while held
+
+    def _submit_fetch(self, url: str):
+        with self._inflight_lock:
+            future = self._inflight.get(url)
+            if future is None:
+                future = _executor.submit(self.fetch_page, url)
+                self._inflight[url] = future
+                future.add_done_callback(lambda _: self._forget(url))
+            return future
+
+    def _forget(self, url: str):
+        with self._inflight_lock:
+            self._inflight.pop(url, None)
+
+    def search(self, query: str) -> List[dict]:
+        key = f"search:{self.provider.name}:{normalise_query(query)}"
+        results = self.cache.get(key, SEARCH_TTL)
+        if results is None:
+            results = self.provider.search(query, MAX_PAGES * 2)
+            self.cache.set(key, results)
+        return results
+
+    def fetch_page(self, url: str) -> Optional[str]:
+        """Plain text of a page, or None for non-text content (PDFs, images, ...)"""
+        key = f"page:{url}"
+        cached = self.cache.get(key, PAGE_TTL)
+        if cached is not None:
+            return cached["text"]
+        with _http.stream("GET", url) as resp:
+            resp.raise_for_status()
+            content_type = resp.headers.get("content-type", "").lower()
+            if not content_type.startswith(TEXT_TYPES):
+                text = None
+            else:
+                body = bytearray()
+                for chunk in resp.iter_bytes():
+                    body.extend(chunk)
+                    if len(body) >= MAX_PAGE_BYTES:
+                        break
+                raw = bytes(body[:MAX_PAGE_BYTES]).decode(resp.charset_encoding or "utf-8", errors="replace")
+                text = html_to_text(raw) if "html" in content_type else raw
+        # Cache even if the turn that asked for it has already moved on
+        self.cache.set(key, {"text": text})
+        return text
+
+    def augment(self, query: str, deadline: float = STAGE_DEADLINE) -> Optional[dict]:
+        """
+        Run the web stage for one turn.
+
+        Returns:
+            {"prompt": section for the system prompt, "sources": [urls]}, or None
+            when nothing useful came back in time
+        """
+        start = time.monotonic()
+        try:
+            search_future = _executor.submit(self.search, query)
+            results = search_future.result(timeout=deadline)
+        except Exception as e:
+            logger.warning(f"Web search failed: {e}")
+            return None
+
+        results = results[:MAX_PAGES]
+        remaining = max(0.0, deadline - (time.monotonic() - start))
+        futures = {self._submit_fetch(r["url"]): r for r in results}
+        done, not_done = wait(futures, timeout=remaining)
+        if not_done:
+            logger.info(f"Web stage: dropped {len(not_done)} slow page(s)")
+
+        sections = []
+        sources = []
+        for future, result in futures.items():
+            text = None
+            if future in done and future.exception() is None:
+                text = future.result()
+            body = (text or result.get("snippet") or "")[:PAGE_CHARS]
+            if not body:
+                continue
+            sections.append(f"--- {result['title'] or result['url']} ({result['url']}) ---\n{body}")
+            sources.append(result["url"])
+
+        if not sections:
+            return None
+        prompt = "=== WEB RESULTS (may be more current than your training data) ===\n" + "\n\n".join(sections) + "\n=================================================================="
+        return {"prompt": prompt, "sources": sources}
+
+
+def _build_augmenter() -> Optional[WebAugmenter]:
+    provider_name = os.environ.get("KAGE_SEARCH_PROVIDER", "searxng")
+    url = os.environ.get("KAGE_SEARCH_URL")
+    if not url or provider_name not in PROVIDERS:
+        return None
+    return WebAugmenter(PROVIDERS[provider_name](url), DiskCache(CACHE_DIR))
+
+
+# Global augmenter, None when no provider is configured
+_augmenter = _build_augmenter()
+WEB_SEARCH_DEFAULT = os.environ.get("KAGE_WEB_SEARCH", "").lower() in ("1", "true", "yes")
+
+def get_augmenter() -> Optional[WebAugmenter]:
+    """Get the global web augmenter, or None if web search is not configured"""
+    return _augmenter
@@ -0,0 +1,37 @@
+import argparse
+import json
+import sys
+from backend.batch_runner import BatchRunner, load_jobs
+
+BASE_URL = "http://localhost:8000/api"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through Kage no Koe")
+    parser.add_argument("jobs", help="Input JSONL, one {id, message, chat_id|project_id, model} per line")
+    parser.add_argument("output", help="Output JSONL (appended to; re-run to resume)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds per request")
+    parser.add_argument("--retry-errors", action="store_true",
+                        help="On resume, re-send jobs that failed before (they may have completed on the server)")
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.jobs)
+    runner = BatchRunner(args.base_url, concurrency=args.concurrency, timeout=args.timeout)
+
+    def print_progress(result, finished, total):
+        mark = "✅" if result["status"] == "ok" else "❌"
+        print(f"\r{mark} {finished}/{total} (last: {result['id']}, {result['latency_ms']:.0f} ms)", end="", flush=True)
+
+    print(f"Running {len(jobs)} jobs with concurrency {args.concurrency}...")
+    try:
+        stats = runner.run(jobs, args.output, progress_callback=print_progress, retry_errors=args.retry_errors)
+    except KeyboardInterrupt:
+        print(f"\n👋 Interrupted. Re-run the same command to resume from {args.output}")
+        sys.exit(130)
+
+    print("\n" + json.dumps(stats, indent=2))
+    sys.exit(1 if stats["errors"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 import requests
 import json
 import sys
+from backend.ollama_pool import get_generation_pool, NoBackendAvailable
+from backend.autotune import load_tunings, runtime_options, keep_alive
 
-# Configuration
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+# Configuration (backends come from KAGE_OLLAMA_BACKENDS / OLLAMA_HOST)
 MODEL = "llama3.2:1b"
 
 def chat():
@@ -15,7 +16,9 @@ def chat():
     # or just simple generate with context. 
     # Let's use /api/chat which is more modern for Ollama conversations.
     
-    chat_url = "http://localhost:11434/api/chat"
+    pool = get_generation_pool()
+    load_tunings()
+    http = requests.Session()  # keep-alive across turns
     history = []
 
     while True:
@@ -32,25 +35,30 @@ def chat():
             
             print("AI: ", end="", flush=True)
 
-            payload = {
-                "model": MODEL,
-                "messages": history,
-                "stream": True
-            }
-
             full_response = ""
             try:
-                with requests.post(chat_url, json=payload, stream=True) as r:
-                    r.raise_for_status()
-                    for line in r.iter_lines():
-                        if line:
-                            body = json.loads(line)
-                            if "message" in body and "content" in body["message"]:
-                                chunk = body["message"]["content"]
-                                print(chunk, end="", flush=True)
-                                full_response += chunk
-                            if body.get("done", False):
-                                break
+                with pool.lease(MODEL) as backend:
+                    payload = {
+                        "model": MODEL,
+                        "messages": history,
+                        "stream": True,
+                        "options": runtime_options(backend.url, MODEL),
+                        "keep_alive": keep_alive(backend.url, MODEL)
+                    }
+                    with http.post(f"{backend.url}/api/chat", json=payload, stream=True) as r:
+                        r.raise_for_status()
+                        for line in r.iter_lines():
+                            if line:
+                                body = json.loads(line)
+                                if "message" in body and "content" in body["message"]:
+                                    chunk = body["message"]["content"]
+                                    print(chunk, end="", flush=True)
+                                    full_response += chunk
+                                if body.get("done", False):
+                                    break
+            except NoBackendAvailable as e:
+                print(f"\n❌ {e}")
+                continue
             except requests.exceptions.RequestException as e:
                 print(f"\n❌ Error contacting Ollama: {e}")
                 print("Make sure Ollama is running (try 'ollama serve' in another terminal)")
@@ -3,14 +3,20 @@ import os
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from backend.database import create_db_and_tables
+from backend.autotune import load_tunings
+from backend.memory import get_memory_store
+from backend.ollama_pool import get_generation_pool, get_embedding_pool
+from backend.http_cache import FastJSONResponse
+from backend.query_counter import QueryBudgetMiddleware
 from backend.routes import projects, chats, settings, chat_api
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Kage no Koe API")
+app = FastAPI(title="Kage no Koe API", default_response_class=FastJSONResponse)
 
 # Allow CORS for development (React/Vite usually runs on port 5173)
 app.add_middleware(
@@ -21,10 +27,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON payloads (long chat histories). Brotli is optional and
+# also falls back to gzip for clients that don't accept br.
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Flag endpoints that exceed their declared @query_budget
+app.add_middleware(QueryBudgetMiddleware)
+
 # Initialize Database on Startup
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    # Health/inventory checks run in the background; routing reads their results
+    get_generation_pool().start_monitor()
+    get_embedding_pool().start_monitor()
+    load_tunings()
+    get_memory_store().load()
 
 # Include Routers
 app.include_router(projects.router)
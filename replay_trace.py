@@ -0,0 +1,225 @@
+"""
+Replay recorded request traces and compare per-stage latencies between builds.
+
+Record a trace on the build you care about:
+    KAGE_TRACE_FILE=trace.jsonl uvicorn main:app
+
+Replay it in-process against a throwaway database and a stub Ollama, recording
+a fresh trace for this build:
+    python replay_trace.py replay trace.jsonl --out build_a.jsonl --stub-ollama
+
+Or re-drive a running server (start it with KAGE_TRACE_FILE to capture stages):
+    python replay_trace.py replay trace.jsonl --out client.jsonl --base-url http://localhost:8000
+
+Then diff two runs:
+    python replay_trace.py diff build_a.jsonl build_b.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def text_of(value, filler="lorem "):
+    """Recover text from a trace field; anonymised fields become filler of the same length"""
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        length = value.get("length", 0)
+        return (filler * (length // len(filler) + 1))[:length]
+    return value
+
+
+class Replayer:
+    """Re-drives trace records through the API, mapping recorded ids onto new ones"""
+
+    def __init__(self, client, prefix=""):
+        self.client = client
+        self.prefix = prefix
+        self.chat_ids = {}
+        self.project_ids = {}
+        self.global_context = None
+
+    def _url(self, path):
+        return f"{self.prefix}{path}"
+
+    def _project(self, record):
+        recorded = record.get("project_id")
+        if recorded is None:
+            return None
+        if recorded not in self.project_ids:
+            resp = self.client.post(self._url("/api/projects/"), json={
+                "name": f"Replay project {recorded}",
+                "context_text": text_of(record.get("project_context")),
+            })
+            resp.raise_for_status()
+            self.project_ids[recorded] = resp.json()["id"]
+        return self.project_ids[recorded]
+
+    def _chat(self, record):
+        recorded = record.get("chat_id")
+        if recorded not in self.chat_ids:
+            project_id = self._project(record)
+            params = {"project_id": project_id} if project_id else None
+            resp = self.client.post(self._url("/api/chats/"), params=params, json={
+                "title": f"Replay chat {recorded}",
+                "context_text": text_of(record.get("chat_context")),
+            })
+            resp.raise_for_status()
+            self.chat_ids[recorded] = resp.json()["id"]
+        return self.chat_ids[recorded]
+
+    def send(self, record):
+        route = record["route"]
+        if route == "chat_completion":
+            global_context = text_of(record.get("global_context")) or ""
+            if global_context != self.global_context:
+                self.client.post(self._url("/api/settings/"), json={"global_context_text": global_context})
+                self.global_context = global_context
+            chat_id = self._chat(record)
+            return self.client.post(self._url("/api/chat_completion/"), json={
+                "chat_id": chat_id,
+                "user_message": text_of(record.get("user_message")) or "",
+                "model": record.get("model"),
+            })
+        if route == "add_context":
+            chat_id = self._chat(record)
+            return self.client.post(self._url(f"/api/chat_completion/{chat_id}/context"), json={
+                "name": text_of(record.get("name")) or "context",
+                "content": text_of(record.get("content")) or "",
+                "type": record.get("type", "text"),
+            })
+        if route == "upload":
+            content = text_of(record.get("content")) or ""
+            files = {"file": (text_of(record.get("filename")) or "upload.txt", content.encode("utf-8"))}
+            return self.client.post(self._url("/api/chat_completion/upload"), files=files)
+        return None
+
+
+def replay(args):
+    records = load_trace(args.trace)
+    print(f"Replaying {len(records)} requests from {args.trace}")
+
+    if args.base_url:
+        import requests
+        client = requests.Session()
+        replayer = Replayer(client, prefix=args.base_url.rstrip("/"))
+        client_log = args.out
+    else:
+        # In-process: fresh database, recorder pointed at --out, optional stub Ollama.
+        # These must be set before the app modules are imported.
+        if os.path.exists(args.out):
+            os.remove(args.out)
+        os.environ["KAGE_TRACE_FILE"] = args.out
+        # Never the configured KAGE_DB: replay creates projects, chats and messages
+        os.environ["KAGE_DB"] = args.db or os.path.join(tempfile.mkdtemp(prefix="kage-replay-"), "replay.db")
+        # Background benchmarks on a fresh database would skew the replayed timings
+        os.environ.setdefault("KAGE_AUTO_CALIBRATE", "0")
+        if args.stub_ollama:
+            from backend import ollama_stub
+            server = ollama_stub.serve(port=0, latency=args.stub_latency, background=True)
+            stub_url = f"http://127.0.0.1:{server.server_port}"
+            # Override any configured pool so nothing reaches a real backend
+            for var in ("OLLAMA_HOST", "KAGE_OLLAMA_BACKENDS", "KAGE_OLLAMA_EMBED_BACKENDS"):
+                os.environ[var] = stub_url
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+        client.__enter__()
+        replayer = Replayer(client)
+        client_log = None
+
+    failures = 0
+    with open(client_log, "w", encoding="utf-8") if client_log else open(os.devnull, "w") as log:
+        for i, record in enumerate(records, 1):
+            start = time.perf_counter()
+            resp = replayer.send(record)
+            if resp is None:
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            if resp.status_code >= 400:
+                failures += 1
+                print(f"  [{i}] {record['route']} -> HTTP {resp.status_code}")
+            # Only client-side timings are available when driving a remote server
+            log.write(json.dumps({"route": record["route"], "status": str(resp.status_code),
+                                  "total_ms": round(elapsed, 3), "stages": {}}) + "\n")
+
+    print(f"Done: {len(records)} requests, {failures} failures. Trace written to {args.out}")
+    return 1 if failures else 0
+
+
+def summarise(records):
+    """{(route, stage): [ms, ...]} including a synthetic 'total' stage"""
+    samples = {}
+    for r in records:
+        stages = dict(r.get("stages", {}))
+        stages["total"] = r.get("total_ms", 0)
+        for stage, ms in stages.items():
+            samples.setdefault((r["route"], stage), []).append(ms)
+    return samples
+
+
+def p95(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+def diff(args):
+    base = summarise(load_trace(args.baseline))
+    new = summarise(load_trace(args.candidate))
+    regressions = 0
+
+    print(f"{'route/stage':<32}{'n':>5}{'base p50':>11}{'new p50':>11}{'Δ p50':>9}{'base p95':>11}{'new p95':>11}")
+    for key in sorted(set(base) | set(new)):
+        a, b = base.get(key), new.get(key)
+        name = f"{key[0]}/{key[1]}"
+        if not a or not b:
+            print(f"{name:<32}  only in {'baseline' if a else 'candidate'}")
+            continue
+        a50, b50 = statistics.median(a), statistics.median(b)
+        change = (b50 - a50) / a50 * 100 if a50 else 0.0
+        flag = ""
+        if change > args.threshold and b50 - a50 > args.min_ms:
+            flag = "  <-- slower"
+            regressions += 1
+        print(f"{name:<32}{min(len(a), len(b)):>5}{a50:>11.1f}{b50:>11.1f}{change:>8.1f}%{p95(a):>11.1f}{p95(b):>11.1f}{flag}")
+
+    if regressions:
+        print(f"\n{regressions} stage(s) regressed by more than {args.threshold}%")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay and diff Kage no Koe request traces")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("replay", help="Re-drive a trace against the app")
+    p.add_argument("trace")
+    p.add_argument("--out", required=True, help="Where to write the new trace")
+    p.add_argument("--base-url", help="Replay against a running server instead of in-process")
+    p.add_argument("--db", help="Database file for in-process replay (default: a new temporary one)")
+    p.add_argument("--stub-ollama", action="store_true", help="Serve a stub Ollama for in-process replay")
+    p.add_argument("--stub-latency", type=float, default=0.0, help="Seconds of fake latency per stub call")
+    p.set_defaults(func=replay)
+
+    p = sub.add_parser("diff", help="Compare per-stage latencies of two traces")
+    p.add_argument("baseline")
+    p.add_argument("candidate")
+    p.add_argument("--threshold", type=float, default=10.0, help="Percent slowdown that counts as a regression")
+    p.add_argument("--min-ms", type=float, default=1.0, help="Ignore regressions smaller than this many ms")
+    p.set_defaults(func=diff)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
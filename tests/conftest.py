@@ -0,0 +1,47 @@
+"""
+Shared fixtures: the FastAPI app on a throwaway database, talking to the stub
+Ollama server. Configuration is read at import time, so the environment is
+set up here before any backend module is imported.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend import ollama_stub
+
+_stub = ollama_stub.serve(port=0, background=True)
+_stub_url = f"http://127.0.0.1:{_stub.server_port}"
+for _var in ("OLLAMA_HOST", "KAGE_OLLAMA_BACKENDS", "KAGE_OLLAMA_EMBED_BACKENDS"):
+    os.environ[_var] = _stub_url
+os.environ["KAGE_DB"] = os.path.join(tempfile.mkdtemp(prefix="kage-tests-"), "test.db")
+os.environ["KAGE_QUERY_BUDGET_STRICT"] = "1"
+os.environ["KAGE_AUTO_CALIBRATE"] = "0"  # tests that want it turn it on explicitly
+os.environ["KAGE_WEB_CACHE_DIR"] = os.path.join(tempfile.mkdtemp(prefix="kage-tests-"), "web")
+for _var in ("KAGE_TRACE_FILE", "KAGE_SESSION_AFFINITY", "KAGE_MEMORY", "KAGE_WEB_SEARCH", "KAGE_SEARCH_URL",
+             "KAGE_HTTP_CACHE"):
+    os.environ.pop(_var, None)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def chat(client):
+    """A chat inside a project, with some text context and one file"""
+    project_id = client.post("/api/projects/", json={"name": "Test", "context_text": "Project notes"}).json()["id"]
+    chat_id = client.post("/api/chats/", params={"project_id": project_id}, json={"title": "Test chat"}).json()["id"]
+    for i in range(3):
+        client.post(f"/api/chat_completion/{chat_id}/context", json={"name": f"note {i}", "content": "abc"})
+    client.post(f"/api/chat_completion/{chat_id}/context", json={"name": "f.txt", "content": "file text", "type": "file"})
+    return {"project_id": project_id, "chat_id": chat_id}
@@ -0,0 +1,63 @@
+"""
+Calibration against the stub Ollama: started automatically on first use,
+measures every tuned option and keeps chat turns off the model meanwhile.
+"""
+import time
+
+import pytest
+
+from backend import autotune
+from backend.autotune import Calibrator, get_calibrator, runtime_options
+
+
+@pytest.fixture
+def fresh(client, monkeypatch):
+    """No tunings or slots yet, as on a fresh database"""
+    monkeypatch.setattr(autotune, "_tunings", {})
+    monkeypatch.setattr(autotune, "_slots", {})
+    monkeypatch.setattr(autotune, "_auto_started", set())
+    monkeypatch.setattr(autotune, "CONCURRENCY_CANDIDATES", (1, 2))
+    return autotune.get_generation_pool().backends[0].url
+
+
+def wait_for_calibration(key, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while get_calibrator().status.get(key, {}).get("status") in (None, "running"):
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+    return get_calibrator().status[key]
+
+
+def test_first_use_calibrates_in_the_background(fresh, monkeypatch):
+    monkeypatch.setattr(autotune, "AUTO_CALIBRATE", True)
+    runtime_options(fresh, "llama3.2:1b")
+    runtime_options(fresh, "llama3.2:1b")
+    assert wait_for_calibration((fresh, "llama3.2:1b"))["status"] == "completed"
+
+    tuning = autotune.get_tuning(fresh, "llama3.2:1b")
+    assert tuning.calibrated_at is not None
+    assert tuning.num_ctx in autotune.CONTEXT_CANDIDATES
+    assert tuning.max_concurrency in (1, 2)
+    assert autotune._auto_started == {(fresh, "llama3.2:1b")}
+
+
+def test_no_auto_calibration_when_disabled(fresh):
+    runtime_options(fresh, "llama3.2:1b")
+    assert not autotune._auto_started
+
+
+def test_benchmarks_hold_every_generation_slot(fresh, monkeypatch):
+    free_during_bench = []
+    generate = Calibrator._generate
+
+    def spy(self, backend, model, *args):
+        slot, _ = autotune._slots[(backend.url, model)]
+        if slot.acquire(blocking=False):
+            free_during_bench.append(True)
+            slot.release()
+        return generate(self, backend, model, *args)
+
+    monkeypatch.setattr(Calibrator, "_generate", spy)
+    get_calibrator().start("llama3.2:1b", fresh)
+    assert wait_for_calibration((fresh, "llama3.2:1b"))["status"] == "completed"
+    assert not free_during_bench
@@ -0,0 +1,108 @@
+"""
+Batch runner against a stub chat API: per-chat ordering, interrupts and resume.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.batch_runner import BatchRunner, previous_results
+
+
+class _StubChatAPI(BaseHTTPRequestHandler):
+    """/api/chats/ creates chats; /api/chat_completion/ fails for messages starting with 'fail'"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        if self.path.startswith("/api/chats/"):
+            with server.lock:
+                server.chats += 1
+                out, status = {"id": 1000 + server.chats}, 200
+        else:
+            time.sleep(server.delay)
+            with server.lock:
+                server.turns.append((body["chat_id"], body["user_message"]))
+            if body["user_message"].startswith("fail") and not server.recovered:
+                out, status = {"detail": "boom"}, 500
+            else:
+                out, status = {"content": f"re: {body['user_message']}"}, 200
+        data = json.dumps(out).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubChatAPI)
+    server.lock = threading.Lock()
+    server.chats, server.turns, server.delay, server.recovered = 0, [], 0.01, False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def runner_for(server, concurrency=4):
+    return BatchRunner(f"http://127.0.0.1:{server.server_port}/api", concurrency=concurrency, timeout=10)
+
+
+def test_lanes_keep_chat_turns_in_file_order():
+    jobs = [{"id": "1", "message": "a", "chat_id": 7}, {"id": "2", "message": "b"},
+            {"id": "3", "message": "c", "chat_id": 8}, {"id": "4", "message": "d", "chat_id": 7},
+            {"id": "5", "message": "e", "chat_id": "8"}]
+    lanes = BatchRunner.lanes(jobs)
+    assert [[job["id"] for job in lane] for lane in lanes] == [["1", "4"], ["2"], ["3", "5"]]
+
+
+def test_turns_in_a_chat_run_in_order(api, tmp_path):
+    jobs = [{"id": str(i), "message": f"m{i}", "chat_id": 1 + i % 3} for i in range(30)]
+    stats = runner_for(api).run(jobs, str(tmp_path / "out.jsonl"))
+    assert stats["ok"] == 30
+    for chat_id in (1, 2, 3):
+        sent = [int(message[1:]) for chat, message in api.turns if chat == chat_id]
+        assert sent == sorted(sent)
+
+
+def test_interrupt_sends_no_queued_jobs(api, tmp_path):
+    out = tmp_path / "out.jsonl"
+    jobs = [{"id": str(i), "message": f"m{i}"} for i in range(40)]
+
+    def interrupt(result, finished, total):
+        if finished == 2:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        runner_for(api, concurrency=2).run(jobs, str(out), progress_callback=interrupt)
+    recorded = previous_results(str(out))
+    assert len(api.turns) == len(recorded) <= 4
+
+    runner_for(api).run(jobs, str(out))
+    assert len(api.turns) == 40  # the resume sent each remaining job once
+
+
+def test_resume_skips_errors_unless_asked(api, tmp_path):
+    out = str(tmp_path / "out.jsonl")
+    jobs = [{"id": "1", "message": "ok one", "chat_id": 5}, {"id": "2", "message": "fail two", "chat_id": 5},
+            {"id": "3", "message": "fail fresh"}]
+    stats = runner_for(api).run(jobs, out)
+    assert stats["errors"] == 2
+    fresh_chat = previous_results(out)["3"]["chat_id"]
+
+    api.recovered = True
+    sent = len(api.turns)
+    stats = runner_for(api).run(jobs, out)
+    assert stats["jobs"] == 0 and stats["skipped"] == 3
+    assert len(api.turns) == sent  # a failed turn may have landed server-side; don't duplicate it
+
+    chats = api.chats
+    stats = runner_for(api).run(jobs, out, retry_errors=True)
+    assert stats["ok"] == 2
+    assert api.chats == chats  # the failed fresh job reuses its chat
+    assert (fresh_chat, "fail fresh") in api.turns[sent:]
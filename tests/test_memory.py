@@ -0,0 +1,136 @@
+"""
+Long-term memory recall in the chat prompt, and the idle-only extraction path.
+"""
+import time
+
+import pytest
+from sqlmodel import Session
+
+from backend import memory
+from backend.database import engine
+from backend.memory import get_memory_store
+from backend.ollama_pool import get_generation_pool
+from backend.routes import chat_api
+from backend.session_cache import get_session_cache
+
+TOPICS = ["code blocks", "dates", "units", "tone", "citations", "lists", "headings", "names", "numbers", "links",
+          "tables", "emoji", "language", "length", "quotes", "acronyms", "currency", "timezones", "greetings", "apologies"]
+RULES = "\n\n".join(f"Rule {i + 1}: always handle {t} carefully when answering; {t} matter for {t} consistency."
+                    for i, t in enumerate(TOPICS))
+
+
+@pytest.fixture
+def prompts(client, monkeypatch):
+    """Memory on, the global blob indexed; yields the system prompts sent to the model"""
+    store = get_memory_store()
+    monkeypatch.setattr(chat_api, "MEMORY_ENABLED", True)
+    monkeypatch.setattr(chat_api, "SESSION_AFFINITY", False)
+    monkeypatch.setattr(chat_api, "LLAMAINDEX_AVAILABLE", False)
+    monkeypatch.setattr(store, "remember_turn", lambda *args: None)
+
+    client.post("/api/settings/", json={"global_context_text": RULES})
+    store._sync_static(RULES, "global", None)
+    assert store.static_indexed(RULES, "global")
+
+    sent = []
+    fallback = chat_api.fallback_ollama_chat
+
+    def spy(request, model, chat_history, chat, system_prompt, session, trace):
+        sent.append(system_prompt)
+        return fallback(request, model, chat_history, chat, system_prompt, session, trace)
+
+    monkeypatch.setattr(chat_api, "fallback_ollama_chat", spy)
+    yield sent
+
+    client.post("/api/settings/", json={"global_context_text": ""})
+    store._sync_static("", "global", None)
+
+
+def ask(client, chat, message):
+    resp = client.post("/api/chat_completion/", json={"chat_id": chat["chat_id"], "user_message": message})
+    assert resp.status_code == 200, resp.text
+
+
+def test_relevant_excerpts_replace_the_blob(client, chat, prompts):
+    ask(client, chat, "how should I handle currency and currency consistency")
+    assert "GLOBAL INSTRUCTIONS (relevant excerpts, ALWAYS FOLLOW)" in prompts[-1]
+    assert "Rule 17: always handle currency" in prompts[-1]
+    assert RULES not in prompts[-1]
+
+
+def test_blob_is_pasted_when_nothing_is_relevant(client, chat, prompts):
+    ask(client, chat, "What's the weather")
+    assert "=== GLOBAL INSTRUCTIONS (ALWAYS FOLLOW) ===" in prompts[-1]
+    assert RULES in prompts[-1]
+
+
+def test_blob_is_pasted_when_recall_fails(client, chat, prompts, monkeypatch):
+    def broken_recall(*args, **kwargs):
+        raise ConnectionError("embedding backend down")
+
+    monkeypatch.setattr(get_memory_store(), "recall", broken_recall)
+    ask(client, chat, "how should I handle currency and currency consistency")
+    assert "=== GLOBAL INSTRUCTIONS (ALWAYS FOLLOW) ===" in prompts[-1]
+    assert RULES in prompts[-1]
+
+
+def test_extraction_waits_for_an_idle_backend(client, monkeypatch):
+    store = get_memory_store()
+    pool = get_generation_pool()
+    pool.refresh(force=True)
+    backend = pool.backends[0]
+    monkeypatch.setattr(memory, "EXTRACTION_IDLE", 0.2)
+
+    with pool.lease(chat_api.MODEL):
+        assert store.idle_backend(chat_api.MODEL) is None  # generation in flight
+    assert store.idle_backend(chat_api.MODEL) is None      # just finished
+    time.sleep(0.25)
+    assert store.idle_backend(chat_api.MODEL) is backend
+
+
+def test_recall_rides_with_the_turn_on_the_session_path(client, prompts, monkeypatch):
+    monkeypatch.setattr(chat_api, "SESSION_AFFINITY", True)
+    store = get_memory_store()
+    fact = "The user wants currency amounts in euros"
+    with Session(engine) as session:
+        store._add(session, fact, memory.embed([fact])[0], "global", None)
+    fact_id = next(e.id for e in store.entries() if e.content == fact)
+
+    sent = []
+    session_chat = chat_api.session_ollama_chat
+
+    def spy(request, model, chat_history, chat_id, system_prompt, session, trace, turn_context=""):
+        sent.append((system_prompt, turn_context))
+        return session_chat(request, model, chat_history, chat_id, system_prompt, session, trace, turn_context)
+
+    monkeypatch.setattr(chat_api, "session_ollama_chat", spy)
+    cache = get_session_cache()
+    before = cache.stats()
+    chat_id = client.post("/api/chats/", json={"title": "Memory session"}).json()["id"]
+    turns = [client.post("/api/chat_completion/", json={
+        "chat_id": chat_id, "user_message": f"currency amounts in euros, case {i}"}).json() for i in range(4)]
+    store.delete(fact_id)
+
+    assert [t["prompt_eval"]["session_hit"] for t in turns] == [False, True, True, True]
+    assert {key: cache.stats()[key] - before[key] for key in ("hits", "misses")} == {"hits": 3, "misses": 1}
+    assert len({system_prompt for system_prompt, _ in sent}) == 1  # the prefix never changed
+    assert RULES in sent[0][0] and fact not in sent[0][0]  # the whole blob, never per-turn excerpts
+    assert all(fact in turn_context for _, turn_context in sent)
+
+
+def test_extraction_gives_up_without_an_idle_backend(client, monkeypatch):
+    store = get_memory_store()
+    monkeypatch.setattr(memory, "EXTRACTION_MAX_WAIT", 0.2)
+    monkeypatch.setattr(memory, "EXTRACTION_POLL", 0.05)
+    monkeypatch.setattr(memory, "EXTRACTION_IDLE", 0.0)
+    monkeypatch.setattr(memory, "WARM_SESSION_IDLE", 0.0)
+    extracted = []
+    monkeypatch.setattr(store, "_remember_turn", lambda backend_url, chat_id, *rest: extracted.append(chat_id))
+
+    store.remember_turn(1, None, "model-nobody-has", "hi", "hello")
+    store.remember_turn(2, None, chat_api.MODEL, "hi", "hello")
+    deadline = time.monotonic() + 5
+    while not extracted:
+        assert time.monotonic() < deadline, "the queue is stuck behind the first turn"
+        time.sleep(0.05)
+    assert extracted == [2]
@@ -0,0 +1,155 @@
+"""
+Routing and circuit breaking across several stub Ollama servers.
+"""
+import socket
+import time
+
+import httpx
+import pytest
+
+from backend import ollama_pool, ollama_stub
+from backend.ollama_pool import BackendPool, NoBackendAvailable
+
+
+@pytest.fixture
+def stubs():
+    servers = []
+
+    def start(models=None):
+        server = ollama_stub.serve(port=0, models=models, background=True)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(urls, routing="least_loaded"):
+        pool = BackendPool("test", urls, routing=routing)
+        pool.refresh(force=True)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.stop_monitor()
+
+
+def dead_url():
+    """A local port with nothing listening on it"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def fail(pool, **lease_args):
+    with pytest.raises(ConnectionError):
+        with pool.lease(**lease_args):
+            raise ConnectionError("connection refused")
+
+
+def test_routes_to_a_backend_that_has_the_model(stubs, make_pool):
+    without, with_model = stubs(["nomic-embed-text"]), stubs(["llama3.2:1b"])
+    pool = make_pool([without, with_model])
+    for _ in range(3):
+        assert pool.select("llama3.2:1b").url == with_model
+
+
+def test_least_loaded_spreads_requests(stubs, make_pool):
+    pool = make_pool([stubs(), stubs()])
+    with pool.lease("llama3.2:1b") as first, pool.lease("llama3.2:1b") as second:
+        assert first is not second
+        assert first.in_flight == second.in_flight == 1
+    assert all(b.in_flight == 0 for b in pool.backends)
+
+
+def test_affinity_keeps_a_model_on_one_backend_and_spills_over(stubs, make_pool):
+    pool = make_pool([stubs(), stubs(), stubs()], routing="affinity")
+    home = pool.select("llama3.2:1b")
+    assert all(pool.select("llama3.2:1b") is home for _ in range(5))
+
+    home.in_flight = 2  # busy: two more than the idle boxes
+    assert pool.select("llama3.2:1b") is not home
+    home.in_flight = 0
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_circuit_opens_and_health_check_closes_it(stubs, make_pool, monkeypatch):
+    monkeypatch.setattr(ollama_pool, "COOLDOWN", 0.2)
+    monkeypatch.setattr(ollama_pool, "MONITOR_TICK", 0.05)
+    a, b = stubs(), stubs()
+    pool = make_pool([a, b])
+    broken = next(x for x in pool.backends if x.url == a)
+    fail(pool, prefer=a)
+    assert broken.failures == 1 and pool.select().url == b  # failed backends are skipped
+    for _ in range(ollama_pool.FAILURE_THRESHOLD - 1):
+        broken.record_failure(trip=pool._can_trip(broken))
+    assert not broken.available
+    assert all(pool.select().url == b for _ in range(3))
+
+    # After the cooldown the monitor's check is the half-open trial; it succeeds
+    wait_for(lambda: broken.healthy and broken.failures == 0)
+    assert broken.available
+    assert pool.select(prefer=a) is broken
+
+
+def test_failed_half_open_check_reopens_immediately(stubs, make_pool, monkeypatch):
+    monkeypatch.setattr(ollama_pool, "COOLDOWN", 0.2)
+    monkeypatch.setattr(ollama_pool, "MONITOR_TICK", 0.05)
+    pool = make_pool([dead_url(), stubs()])
+    dead = pool.backends[0]
+    for _ in range(ollama_pool.FAILURE_THRESHOLD - 1):
+        pool.refresh(force=True)
+    assert not dead.available
+
+    pool.start_monitor()
+    wait_for(lambda: dead.failures > ollama_pool.FAILURE_THRESHOLD)
+    assert not dead.available
+
+
+def test_last_backend_is_never_tripped(stubs, make_pool):
+    pool = make_pool([stubs()])
+    for _ in range(ollama_pool.FAILURE_THRESHOLD * 2):
+        fail(pool)
+    assert pool.backends[0].available
+    assert pool.select() is pool.backends[0]
+
+
+def test_slow_generation_is_not_a_backend_failure(stubs, make_pool):
+    pool = make_pool([stubs()])
+    for _ in range(ollama_pool.FAILURE_THRESHOLD):
+        with pytest.raises(httpx.ReadTimeout):
+            with pool.lease():
+                raise httpx.ReadTimeout("slow")
+    assert pool.backends[0].failures == 0
+
+
+def test_dead_backend_is_skipped_without_blocking(stubs, make_pool):
+    live = stubs()
+    pool = make_pool([dead_url(), live])
+    start = time.monotonic()
+    for _ in range(3):
+        assert pool.select("llama3.2:1b").url == live
+    assert time.monotonic() - start < 0.1  # routing never health-checks inline
+
+
+def test_no_backend_available(make_pool):
+    pool = make_pool([dead_url()])
+    pool.backends[0].open_until = time.monotonic() + 60
+    with pytest.raises(NoBackendAvailable):
+        pool.select()
+
+
+def test_default_port_is_kept():
+    assert ollama_pool.normalise_url("127.0.0.1") == "http://127.0.0.1:11434"
@@ -0,0 +1,50 @@
+"""
+Query-count regression tests: each endpoint must stay within its declared
+@query_budget however much data it returns.
+"""
+from backend.query_counter import assert_max_queries
+from backend.routes import chat_api, chats, projects
+
+
+def test_chat_completion_budget_is_constant(client, chat):
+    budget = chat_api.chat_completion.__query_budget__
+    # Later turns carry more history but must not run more queries
+    for i in range(3):
+        with assert_max_queries(budget, "chat_completion") as counter:
+            resp = client.post("/api/chat_completion/", json={"chat_id": chat["chat_id"], "user_message": f"hello {i}"})
+        assert resp.status_code == 200, resp.text
+    assert counter.count == budget
+
+
+def test_read_chat_messages_budget(client, chat):
+    client.post("/api/chat_completion/", json={"chat_id": chat["chat_id"], "user_message": "hello"})
+    with assert_max_queries(chats.read_chat_messages.__query_budget__, "read_chat_messages"):
+        resp = client.get(f"/api/chats/{chat['chat_id']}/messages")
+    assert resp.status_code == 200
+    assert [m["role"] for m in resp.json()] == ["user", "assistant"]
+
+
+def test_context_items_budget(client, chat):
+    with assert_max_queries(chat_api.get_context_items.__query_budget__, "get_context_items"):
+        resp = client.get(f"/api/chat_completion/{chat['chat_id']}/context")
+    assert resp.status_code == 200
+    assert len(resp.json()) == 4
+
+
+def test_read_chats_budget(client, chat):
+    with assert_max_queries(chats.read_chats.__query_budget__, "read_chats"):
+        resp = client.get("/api/chats/")
+    assert resp.status_code == 200
+
+
+def test_read_projects_budget(client, chat):
+    with assert_max_queries(projects.read_projects.__query_budget__, "read_projects"):
+        resp = client.get("/api/projects/")
+    assert resp.status_code == 200
+
+
+def test_not_modified_runs_no_queries(client, chat):
+    etag = client.get("/api/projects/").headers["etag"]
+    with assert_max_queries(0, "conditional read_projects"):
+        resp = client.get("/api/projects/", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
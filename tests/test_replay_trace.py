@@ -0,0 +1,46 @@
+"""
+Trace round trip: record through the app, replay in-process against the stub
+Ollama, then diff the two replays.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from backend import trace_recorder
+from backend.trace_recorder import TraceRecorder
+
+from conftest import ROOT
+
+
+def run_tool(*args):
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("KAGE_", "OLLAMA_"))}
+    return subprocess.run([sys.executable, os.path.join(ROOT, "replay_trace.py"), *args],
+                          cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+
+
+def test_record_replay_diff(client, chat, tmp_path, monkeypatch):
+    recorded = tmp_path / "recorded.jsonl"
+    monkeypatch.setattr(trace_recorder, "_recorder", TraceRecorder(str(recorded), anonymise=True))
+    client.post(f"/api/chat_completion/{chat['chat_id']}/context", json={"name": "notes", "content": "secret notes"})
+    for i in range(3):
+        client.post("/api/chat_completion/", json={"chat_id": chat["chat_id"], "user_message": f"private question {i}"})
+
+    records = [json.loads(line) for line in recorded.read_text().splitlines()]
+    assert [r["route"] for r in records] == ["add_context"] + ["chat_completion"] * 3
+    assert "private question" not in recorded.read_text()
+    assert "generate" in records[-1]["stages"]
+
+    for name in ("a", "b"):
+        db = tmp_path / f"{name}.db"
+        result = run_tool("replay", str(recorded), "--out", str(tmp_path / f"{name}.jsonl"),
+                          "--stub-ollama", "--db", str(db))
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert db.exists()
+        replayed = [json.loads(line) for line in (tmp_path / f"{name}.jsonl").read_text().splitlines()]
+        assert [r["route"] for r in replayed] == [r["route"] for r in records]
+
+    result = run_tool("diff", str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl"), "--threshold", "100000")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "chat_completion/total" in result.stdout
+    assert "chat_completion/generate" in result.stdout
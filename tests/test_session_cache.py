@@ -0,0 +1,54 @@
+"""
+Session affinity: follow-up turns continue the chat's Ollama context.
+"""
+import pytest
+
+from backend.routes import chat_api
+from backend.session_cache import get_session_cache
+
+
+class _FakeAugmenter:
+    """Different web results for every question, like a real search"""
+
+    def augment(self, query):
+        return {"prompt": f"=== WEB RESULTS ===\nfresh results about {query}\n===", "sources": ["http://example.test/"]}
+
+
+@pytest.fixture
+def sessions(client, monkeypatch):
+    monkeypatch.setattr(chat_api, "SESSION_AFFINITY", True)
+    cache = get_session_cache()
+    before = cache.stats()
+    return lambda: {key: cache.stats()[key] - before[key] for key in ("hits", "misses")}
+
+
+def session_chat(client):
+    chat_id = client.post("/api/chats/", json={"title": "Session chat", "context_text": "instructions " * 100}).json()["id"]
+    return lambda message, **extra: client.post("/api/chat_completion/", json={
+        "chat_id": chat_id, "user_message": message, **extra}).json()
+
+
+def test_follow_up_turns_reuse_the_context(client, sessions):
+    ask = session_chat(client)
+    turns = [ask(f"question {i}") for i in range(4)]
+    assert [t["prompt_eval"]["session_hit"] for t in turns] == [False, True, True, True]
+    assert all(t["prompt_eval"]["evaluated_tokens"] < 20 for t in turns[1:])
+    assert sessions() == {"hits": 3, "misses": 1}
+
+
+def test_web_results_ride_with_the_turn_not_the_prefix(client, sessions, monkeypatch):
+    monkeypatch.setattr(chat_api, "get_augmenter", lambda: _FakeAugmenter())
+    ask = session_chat(client)
+    turns = [ask(f"news {i}", web_search=True) for i in range(4)]
+    assert [t["prompt_eval"]["session_hit"] for t in turns] == [False, True, True, True]
+    assert "news 3" in turns[-1]["content"]
+    assert sessions() == {"hits": 3, "misses": 1}
+
+
+def test_abandoned_continuation_counts_as_a_miss(client, sessions):
+    ask = session_chat(client)
+    first = ask("hello")
+    get_session_cache()._states[first["chat_id"]].backend_url = "http://elsewhere:11434"
+    second = ask("again")
+    assert not second["prompt_eval"]["session_hit"]
+    assert sessions() == {"hits": 0, "misses": 2}
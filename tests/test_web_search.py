@@ -0,0 +1,93 @@
+"""
+Web augmentation against a local stub search engine and web server.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from backend import web_search
+from backend.web_search import DiskCache, SearxngProvider, WebAugmenter
+
+ARTICLE = "<html><head><title>Article</title><script>var tracking = 1;</script></head><body><p>Ollama runs models locally.</p></body></html>"
+
+
+class _StubWeb(BaseHTTPRequestHandler):
+    """SearXNG-style /search plus a few pages with different content types"""
+
+    hits = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path)
+        self.hits.append(path.path)
+        base = f"http://127.0.0.1:{self.server.server_port}"
+        if path.path == "/search":
+            pages = parse_qs(path.query)["q"][0].split()
+            results = [{"title": p, "url": f"{base}/{p}", "content": f"snippet for {p}"} for p in pages]
+            self._send(json.dumps({"results": results}).encode(), "application/json")
+        elif path.path == "/article":
+            self._send(ARTICLE.encode(), "text/html; charset=utf-8")
+        elif path.path == "/report":
+            self._send(b"%PDF-1.7\n\x00\x01\x02binary", "application/pdf")
+        elif path.path == "/huge":
+            self._send(b"x" * (web_search.MAX_PAGE_BYTES * 4), "text/plain")
+        elif path.path == "/slow":
+            time.sleep(2)
+            self._send(b"too late", "text/plain")
+        else:
+            self.send_error(404)
+
+
+@pytest.fixture
+def augmenter(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubWeb)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _StubWeb.hits = []
+    yield WebAugmenter(SearxngProvider(f"http://127.0.0.1:{server.server_port}"), DiskCache(str(tmp_path)))
+    server.shutdown()
+
+
+def test_html_page_is_reduced_to_text(augmenter):
+    result = augmenter.augment("article")
+    assert "Ollama runs models locally." in result["prompt"]
+    assert "tracking" not in result["prompt"]
+    assert result["sources"][0].endswith("/article")
+
+
+def test_non_text_content_falls_back_to_snippet(augmenter):
+    result = augmenter.augment("report")
+    assert "snippet for report" in result["prompt"]
+    assert "PDF" not in result["prompt"]
+
+
+def test_page_body_is_capped(augmenter):
+    url = f"{augmenter.provider.base_url}/huge"
+    assert len(augmenter.fetch_page(url)) == web_search.MAX_PAGE_BYTES
+
+
+def test_results_are_cached(augmenter):
+    augmenter.augment("article")
+    hits = len(_StubWeb.hits)
+    augmenter.augment("article")
+    assert len(_StubWeb.hits) == hits
+
+
+def test_slow_page_is_dropped_at_deadline(augmenter):
+    start = time.monotonic()
+    result = augmenter.augment("article slow", deadline=0.5)
+    assert time.monotonic() - start < 1.5
+    assert "Ollama runs models locally." in result["prompt"]
+    assert "snippet for slow" in result["prompt"]